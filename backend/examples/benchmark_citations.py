@@ -0,0 +1,71 @@
+import argparse
+import random
+import string
+import time
+
+from agent.utils import insert_citation_markers
+
+
+def insert_citation_markers_by_slicing(text, citations_list):
+    """Previous implementation: re-slice the whole text once per citation."""
+    sorted_citations = sorted(
+        citations_list, key=lambda c: (c["end_index"], c["start_index"]), reverse=True
+    )
+    modified_text = text
+    for citation_info in sorted_citations:
+        end_idx = citation_info["end_index"]
+        marker_to_insert = ""
+        for segment in citation_info["segments"]:
+            marker_to_insert += f" [{segment['label']}]({segment['short_url']})"
+        modified_text = modified_text[:end_idx] + marker_to_insert + modified_text[end_idx:]
+    return modified_text
+
+
+def make_case(length: int, citations: int, seed: int = 0):
+    rng = random.Random(seed)
+    text = "".join(rng.choice(string.ascii_letters + " .,") for _ in range(length))
+    citations_list = []
+    for i in range(citations):
+        end = rng.randrange(1, length)
+        citations_list.append(
+            {
+                "start_index": rng.randrange(0, end),
+                "end_index": end,
+                "segments": [
+                    {"label": f"source{i}", "short_url": f"https://vertexaisearch.cloud.google.com/id/0-{i}"}
+                ],
+            }
+        )
+    return text, citations_list
+
+
+def timed(fn, *args, repeat: int = 3) -> float:
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn(*args)
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def main() -> None:
+    """Compare citation insertion on long texts with many citations."""
+    parser = argparse.ArgumentParser(description="Benchmark citation marker insertion")
+    parser.add_argument("--lengths", default="10000,100000,1000000", help="Comma-separated text lengths")
+    parser.add_argument("--citations", default="100,1000,5000", help="Comma-separated citation counts")
+    args = parser.parse_args()
+
+    print(f"{'chars':>9} {'citations':>9} {'slicing ms':>11} {'single pass ms':>15} {'speedup':>8}")
+    for length in (int(n) for n in args.lengths.split(",")):
+        for count in (int(n) for n in args.citations.split(",")):
+            text, citations_list = make_case(length, count)
+            expected = insert_citation_markers_by_slicing(text, citations_list)
+            if insert_citation_markers(text, citations_list) != expected:
+                raise SystemExit(f"Output mismatch for {length} chars / {count} citations")
+            old = timed(insert_citation_markers_by_slicing, text, citations_list)
+            new = timed(insert_citation_markers, text, citations_list)
+            print(f"{length:>9} {count:>9} {old * 1000:>11.1f} {new * 1000:>15.1f} {old / new:>7.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,132 @@
+import argparse
+import csv
+import json
+import os
+import pathlib
+import time
+import urllib.parse
+import urllib.request
+from collections import defaultdict
+
+# agent/__init__.py loads the compiled graph lazily, so this import does not
+# connect to the AMap MCP server or need GEMINI_API_KEY
+from agent.poi_store import MonthlyClimate, build_poi_store, records_from_amap
+
+AMAP_PLACE_TEXT_URL = "https://restapi.amap.com/v3/place/text"
+DEFAULT_CATEGORIES = "美食,酒店,景点"
+
+
+def fetch_amap_exports(
+    output_dir: pathlib.Path,
+    cities: list[str],
+    categories: list[str],
+    pages: int,
+    page_size: int = 25,
+    qps: float = 3.0,
+) -> None:
+    """Download AMap place search results as <city>_<category>.json exports.
+
+    Uses the AMap web service API with AMAP_API_KEY (the key the MCP server
+    uses). Pages of one city/category are merged into a single response.
+    """
+    key = os.getenv("AMAP_API_KEY")
+    if not key:
+        raise SystemExit("AMAP_API_KEY is not set")
+    output_dir.mkdir(parents=True, exist_ok=True)
+    for city in cities:
+        for category in categories:
+            pois = []
+            for page in range(1, pages + 1):
+                query = urllib.parse.urlencode(
+                    {
+                        "key": key,
+                        "keywords": category,
+                        "city": city,
+                        "citylimit": "true",
+                        "offset": page_size,
+                        "page": page,
+                        "extensions": "all",
+                    }
+                )
+                with urllib.request.urlopen(f"{AMAP_PLACE_TEXT_URL}?{query}", timeout=10) as response:
+                    body = json.load(response)
+                # 和在线调用共用同一个 key，按 QPS 限额放慢
+                time.sleep(1 / qps)
+                if body.get("status") != "1":
+                    raise SystemExit(f"AMap search failed for {city}/{category}: {body.get('info')}")
+                pois.extend(body.get("pois") or [])
+                if len(body.get("pois") or []) < page_size:
+                    break
+            path = output_dir / f"{city}_{category}.json"
+            path.write_text(json.dumps({"pois": pois}, ensure_ascii=False), encoding="utf-8")
+            print(f"Fetched {len(pois)} POIs for {city}/{category} into {path}")
+
+
+def main() -> None:
+    """Build the offline POI snapshot from AMap place search results.
+
+    Either point it at a directory of exported responses named
+    <city>_<category>.json, or pass --fetch to download them first.
+    """
+    parser = argparse.ArgumentParser(description="Build the offline POI snapshot")
+    parser.add_argument(
+        "input_dir",
+        help="Directory of AMap place search responses named <city>_<category>.json",
+    )
+    parser.add_argument("output", help="Path of the snapshot file (POI_STORE_PATH)")
+    parser.add_argument(
+        "--climate",
+        help="CSV with columns city,month,high_c,low_c,precipitation_mm",
+    )
+    parser.add_argument(
+        "--fetch",
+        metavar="CITIES",
+        help="Comma-separated cities to download from AMap into input_dir before building",
+    )
+    parser.add_argument(
+        "--categories",
+        default=DEFAULT_CATEGORIES,
+        help=f"Comma-separated search keywords to download with --fetch (default: {DEFAULT_CATEGORIES})",
+    )
+    parser.add_argument(
+        "--pages",
+        type=int,
+        default=4,
+        help="Result pages of 25 POIs to download per city and category",
+    )
+    args = parser.parse_args()
+
+    input_dir = pathlib.Path(args.input_dir)
+    if args.fetch:
+        fetch_amap_exports(
+            input_dir,
+            [city.strip() for city in args.fetch.split(",") if city.strip()],
+            [category.strip() for category in args.categories.split(",") if category.strip()],
+            args.pages,
+        )
+
+    records = []
+    for path in sorted(input_dir.glob("*.json")):
+        city, _, category = path.stem.partition("_")
+        if not category:
+            print(f"Skipping {path.name}: expected <city>_<category>.json")
+            continue
+        response = json.loads(path.read_text(encoding="utf-8"))
+        records.extend(records_from_amap(city, category, response))
+
+    climate = defaultdict(lambda: [None] * 12)
+    if args.climate:
+        with open(args.climate, encoding="utf-8") as f:
+            for row in csv.DictReader(f):
+                climate[row["city"]][int(row["month"]) - 1] = MonthlyClimate(
+                    high_c=float(row["high_c"]),
+                    low_c=float(row["low_c"]),
+                    precipitation_mm=float(row["precipitation_mm"]),
+                )
+
+    count = build_poi_store(args.output, records, dict(climate))
+    print(f"Wrote {count} POIs and climate norms for {len(climate)} cities to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
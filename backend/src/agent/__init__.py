@@ -1,3 +1,13 @@
-from agent.graph import graph
+import importlib
 
 __all__ = ["graph"]
+
+
+def __getattr__(name):
+    # 编译图时会连接 AMap MCP 服务；只用 poi_store 等模块（例如离线快照构建脚本）时不加载
+    if name == "graph":
+        compiled = importlib.import_module("agent.graph").graph
+        # 导入子模块时 agent.graph 被设成了模块本身，换回编译好的图
+        globals()["graph"] = compiled
+        return compiled
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
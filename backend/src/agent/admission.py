@@ -0,0 +1,270 @@
+import asyncio
+import heapq
+import itertools
+import json
+import logging
+import math
+import re
+import time
+from collections import deque
+from contextlib import asynccontextmanager
+from typing import Any, Deque, Dict, List, Optional, Tuple
+
+from starlette.responses import JSONResponse
+
+logger = logging.getLogger(__name__)
+
+# 数值越小越先执行：交互式用户排在批处理任务前面
+PRIORITIES: Dict[str, int] = {"interactive": 0, "batch": 1}
+
+# 会同步执行整个规划的 LangGraph API 路由
+BLOCKING_RUN_SUFFIXES: Tuple[str, ...] = ("/runs/stream", "/runs/wait")
+# 创建后台 run 的路由：请求立即返回，名额要保持到 run 执行结束
+BACKGROUND_RUN_PATH = re.compile(r"^(/threads/[^/]+)?/runs(/batch)?$")
+
+# 持有后台 run 名额的任务；事件循环只保留弱引用，这里保存强引用直到任务结束
+_background_tasks: set = set()
+
+
+class AdmissionRejected(Exception):
+    """Raised when a plan would wait longer than the admission threshold."""
+
+    def __init__(self, retry_after: float, reason: str):
+        super().__init__(reason)
+        self.retry_after = retry_after
+        self.reason = reason
+
+
+class AdmissionController:
+    """Cap concurrent plans per worker behind a bounded priority queue.
+
+    Plans beyond ``max_concurrent`` wait in a priority queue. A plan is
+    rejected up front, with a retry-after hint, when the queue is full or
+    its estimated wait exceeds ``max_wait_seconds``, so that under overload
+    the worker keeps finishing plans at full speed instead of slowing every
+    request down together.
+    """
+
+    def __init__(
+        self,
+        max_concurrent: int = 4,
+        max_queue: int = 32,
+        max_wait_seconds: float = 30.0,
+        initial_service_seconds: float = 20.0,
+    ):
+        self.max_concurrent = max_concurrent
+        self.max_queue = max_queue
+        self.max_wait_seconds = max_wait_seconds
+        self.avg_service_seconds = initial_service_seconds
+        self._active = 0
+        self._queue: List[Tuple[int, int, asyncio.Future]] = []
+        self._seq = itertools.count()
+        self._waits: Deque[float] = deque(maxlen=500)
+        self._admitted = 0
+        self._rejected = 0
+        self._completed = 0
+
+    def queue_depth(self) -> Dict[str, int]:
+        depth = {name: 0 for name in PRIORITIES}
+        names = {level: name for name, level in PRIORITIES.items()}
+        for level, _, future in self._queue:
+            if not future.done():
+                depth[names[level]] += 1
+        return depth
+
+    def estimated_wait(self, level: int) -> float:
+        """Estimate how long a new plan of priority ``level`` would queue."""
+        if self._active < self.max_concurrent and not self._queue:
+            return 0.0
+        ahead = sum(1 for lvl, _, f in self._queue if lvl <= level and not f.done())
+        return (ahead // self.max_concurrent + 1) * self.avg_service_seconds
+
+    @asynccontextmanager
+    async def acquire(self, priority: str = "interactive"):
+        """Hold one plan slot for the duration of the block."""
+        level = PRIORITIES.get(priority, PRIORITIES["interactive"])
+        enqueued_at = time.monotonic()
+        if self._active < self.max_concurrent and not self._queue:
+            self._active += 1
+        else:
+            wait = self.estimated_wait(level)
+            if len(self._queue) >= self.max_queue or wait > self.max_wait_seconds:
+                self._rejected += 1
+                raise AdmissionRejected(
+                    retry_after=wait,
+                    reason=f"estimated wait {wait:.0f}s with {len(self._queue)} plans queued",
+                )
+            future = asyncio.get_running_loop().create_future()
+            heapq.heappush(self._queue, (level, next(self._seq), future))
+            try:
+                await future
+            except asyncio.CancelledError:
+                # 排队时客户端断开：如果已经拿到名额就转交给下一个
+                if future.done() and not future.cancelled():
+                    self._release()
+                else:
+                    future.cancel()
+                    self._drop_cancelled()
+                raise
+
+        self._admitted += 1
+        self._waits.append(time.monotonic() - enqueued_at)
+        started_at = time.monotonic()
+        try:
+            yield
+        finally:
+            # 用指数滑动平均估计单个规划的耗时
+            elapsed = time.monotonic() - started_at
+            self.avg_service_seconds = 0.8 * self.avg_service_seconds + 0.2 * elapsed
+            self._completed += 1
+            self._release()
+
+    def _release(self) -> None:
+        self._active -= 1
+        while self._queue:
+            _, _, future = heapq.heappop(self._queue)
+            if not future.done():
+                self._active += 1
+                future.set_result(None)
+                return
+
+    def _drop_cancelled(self) -> None:
+        self._queue = [item for item in self._queue if not item[2].done()]
+        heapq.heapify(self._queue)
+
+    def metrics(self) -> Dict[str, Any]:
+        waits = sorted(self._waits)
+        p95 = waits[min(int(0.95 * len(waits)), len(waits) - 1)] if waits else 0.0
+        return {
+            "active": self._active,
+            "max_concurrent": self.max_concurrent,
+            "queue_depth": self.queue_depth(),
+            "admitted": self._admitted,
+            "rejected": self._rejected,
+            "completed": self._completed,
+            "avg_wait_ms": round(sum(waits) / len(waits) * 1000, 1) if waits else 0.0,
+            "p95_wait_ms": round(p95 * 1000, 1),
+            "avg_service_seconds": round(self.avg_service_seconds, 2),
+            "estimated_wait_seconds": {
+                name: round(self.estimated_wait(level), 1) for name, level in PRIORITIES.items()
+            },
+        }
+
+
+def _created_runs(body: bytes) -> List[Tuple[str, str]]:
+    """Return (thread_id, run_id) of the runs in a run-creation response."""
+    try:
+        payload = json.loads(body)
+    except ValueError:
+        return []
+    runs = payload if isinstance(payload, list) else [payload]
+    return [
+        (run["thread_id"], run["run_id"])
+        for run in runs
+        if isinstance(run, dict) and run.get("thread_id") and run.get("run_id")
+    ]
+
+
+class AdmissionMiddleware:
+    """ASGI middleware that runs every plan-creating request through the controller.
+
+    The priority comes from the ``X-Plan-Priority`` header (``interactive``
+    or ``batch``). Pure ASGI is used so the slot is held until a streamed
+    response has been fully sent. Background runs (``POST /threads/{id}/runs``,
+    ``/runs`` and ``/runs/batch``) respond as soon as the run is queued, so
+    their slot is held by a separate task that joins the created runs.
+    """
+
+    def __init__(self, app, controller: AdmissionController):
+        self.app = app
+        self.controller = controller
+
+    async def __call__(self, scope, receive, send):
+        path = scope.get("path", "").rstrip("/")
+        background = bool(BACKGROUND_RUN_PATH.match(path))
+        if (
+            scope["type"] != "http"
+            or scope["method"] != "POST"
+            or not (background or path.endswith(BLOCKING_RUN_SUFFIXES))
+        ):
+            await self.app(scope, receive, send)
+            return
+
+        headers = dict(scope.get("headers") or [])
+        priority = headers.get(b"x-plan-priority", b"interactive").decode().lower()
+        try:
+            if background:
+                await self._admit_background(scope, receive, send, priority)
+            else:
+                async with self.controller.acquire(priority):
+                    await self.app(scope, receive, send)
+        except AdmissionRejected as e:
+            retry_after = max(math.ceil(e.retry_after), 1)
+            response = JSONResponse(
+                {"detail": f"Planner is overloaded: {e.reason}", "retry_after": retry_after},
+                status_code=503,
+                headers={"Retry-After": str(retry_after)},
+            )
+            await response(scope, receive, send)
+
+    async def _admit_background(self, scope, receive, send, priority: str) -> None:
+        created: asyncio.Future = asyncio.get_running_loop().create_future()
+        holder = asyncio.create_task(self._hold_until_done(scope, receive, send, priority, created))
+        _background_tasks.add(holder)
+        holder.add_done_callback(_background_tasks.discard)
+        try:
+            await asyncio.shield(created)
+        except asyncio.CancelledError:
+            # 还在排队时客户端断开：放弃名额；run 已经创建时由 holder 继续持有到结束
+            if not created.done():
+                holder.cancel()
+            raise
+
+    async def _hold_until_done(self, scope, receive, send, priority: str, created: asyncio.Future) -> None:
+        status: Optional[int] = None
+        body = bytearray()
+
+        async def capture(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            elif message["type"] == "http.response.body":
+                body.extend(message.get("body", b""))
+            await send(message)
+
+        try:
+            async with self.controller.acquire(priority):
+                await self.app(scope, receive, capture)
+                created.set_result(None)
+                if status == 200:
+                    for thread_id, run_id in _created_runs(bytes(body)):
+                        await self._join(scope, thread_id, run_id)
+        except Exception as e:
+            # 拒绝和创建 run 时的错误交给请求处理；之后的错误只影响名额释放
+            if not created.done():
+                created.set_exception(e)
+            else:
+                logger.warning("Error waiting for background run: %s", e)
+
+    async def _join(self, scope, thread_id: str, run_id: str) -> None:
+        """Wait for a run to finish through the API's own join route, in process."""
+        path = f"/threads/{thread_id}/runs/{run_id}/join"
+        join_scope = {
+            **scope,
+            "method": "GET",
+            "path": path,
+            "raw_path": path.encode(),
+            "query_string": b"",
+            # 保留认证等请求头，去掉请求体相关的
+            "headers": [
+                (k, v) for k, v in scope.get("headers") or [] if k not in (b"content-length", b"content-type")
+            ],
+        }
+
+        async def receive():
+            return {"type": "http.request", "body": b"", "more_body": False}
+
+        async def discard(message):
+            pass
+
+        await self.app(join_scope, receive, discard)
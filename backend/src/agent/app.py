@@ -1,10 +1,133 @@
 # mypy: disable - error - code = "no-untyped-def,misc"
+import asyncio
+import os
 import pathlib
+from contextlib import asynccontextmanager
 from fastapi import FastAPI, Response
 from fastapi.staticfiles import StaticFiles
+from langgraph_sdk import get_client
+
+from agent.admission import AdmissionController, AdmissionMiddleware
+from agent.prewarm import PrewarmScheduler
+from agent.static_files import PrecompressedStaticFiles
+from agent.graph import prewarm_tool_call
+from agent.runtime import (
+    amap_quota,
+    cancellations,
+    hedger,
+    poi_backend,
+    prewarm_cache,
+    prompt_cache,
+    structured_repair,
+)
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """Run the off-peak pre-warm scheduler alongside the API and clean up prompt caches on shutdown."""
+    task = None
+    if os.getenv("PREWARM_ENABLED", "true").lower() not in ("0", "false", "no"):
+        scheduler = PrewarmScheduler(
+            prewarm_cache,
+            run_tool=prewarm_tool_call,
+            # 只在没有实时规划时调用 AMap
+            is_busy=lambda: admission.metrics()["active"] > 0,
+            top_n=int(os.getenv("PREWARM_TOP_N", "50")),
+            calls_per_minute=float(os.getenv("PREWARM_CALLS_PER_MINUTE", "6")),
+            off_peak_hours=os.getenv("PREWARM_HOURS", "1-7"),
+        )
+        task = asyncio.create_task(scheduler.run_forever())
+    try:
+        yield
+    finally:
+        if task is not None:
+            task.cancel()
+        # 删除本进程创建的 Gemini 上下文缓存，不必等它们过期
+        await prompt_cache.aclose()
+
 
 # Define the FastAPI app
-app = FastAPI()
+app = FastAPI(lifespan=lifespan)
+
+# Cap concurrent plans per worker; excess plans queue by priority or get a 503 with Retry-After
+admission = AdmissionController(
+    max_concurrent=int(os.getenv("MAX_CONCURRENT_PLANS", "4")),
+    max_queue=int(os.getenv("MAX_QUEUED_PLANS", "32")),
+    max_wait_seconds=float(os.getenv("MAX_PLAN_QUEUE_WAIT_SECONDS", "30")),
+)
+app.add_middleware(AdmissionMiddleware, controller=admission)
+
+# Set by create_frontend_router when the precompressed static mode is used
+frontend_files: PrecompressedStaticFiles | None = None
+
+
+@app.get("/metrics/admission")
+async def admission_metrics():
+    """Report live plan concurrency, queue depth and queue wait times."""
+    return admission.metrics()
+
+
+@app.get("/metrics/hedging")
+async def hedging_metrics():
+    """Report hedged LLM request counters and latency percentiles."""
+    return hedger.metrics()
+
+
+@app.get("/metrics/quota")
+async def quota_metrics():
+    """Report AMap quota decisions, throttling and the active backend."""
+    return amap_quota.metrics()
+
+
+@app.post("/plans/{thread_id}/cancel")
+async def cancel_plan(thread_id: str):
+    """Cancel the pending and running plans of a thread through the LangGraph run-cancel API.
+
+    The server aborts the run on whichever worker executes it and marks it
+    interrupted; its last checkpoint is kept, so running the thread again
+    with no input resumes the plan instead of starting over.
+    """
+    client = get_client()
+    runs = []
+    for status in ("pending", "running"):
+        runs += await client.runs.list(thread_id, status=status)
+    for run in runs:
+        await client.runs.cancel(thread_id, run["run_id"], action="interrupt")
+    return {"thread_id": thread_id, "cancelled_runs": [run["run_id"] for run in runs]}
+
+
+@app.get("/metrics/cancellations")
+async def cancellation_metrics():
+    """Report how many plans were cancelled and how much work that saved."""
+    return cancellations.metrics()
+
+
+@app.get("/metrics/poi-store")
+async def poi_store_metrics():
+    """Report offline POI snapshot hits, misses and lookup latency."""
+    if poi_backend is None:
+        return {"enabled": False}
+    return {"enabled": True, **poi_backend.metrics()}
+
+
+@app.get("/metrics/structured-output")
+async def structured_output_metrics():
+    """Report how often malformed structured output was repaired locally or partly regenerated."""
+    return structured_repair.metrics()
+
+
+@app.get("/metrics/frontend")
+async def frontend_metrics():
+    """Report static frontend responses by encoding, 304s and cache reads."""
+    if frontend_files is None:
+        return {"precompressed": False}
+    return {"precompressed": True, **frontend_files.metrics()}
+
+
+@app.get("/metrics/prewarm")
+async def prewarm_metrics():
+    """Report hot destinations, pre-warmed plans and the cold-path traffic they removed."""
+    return await prewarm_cache.ametrics()
 
 
 def create_frontend_router(build_dir="../frontend/dist"):
@@ -13,6 +136,9 @@ def create_frontend_router(build_dir="../frontend/dist"):
     Args:
         build_dir: Path to the React build directory relative to this file.
 
+    Assets are precompressed and served with ETags and long-lived caching
+    unless FRONTEND_PRECOMPRESS is disabled.
+
     Returns:
         A Starlette application serving the frontend.
     """
@@ -34,7 +160,15 @@ def create_frontend_router(build_dir="../frontend/dist"):
 
         return Route("/{path:path}", endpoint=dummy_frontend)
 
-    return StaticFiles(directory=build_path, html=True)
+    if os.getenv("FRONTEND_PRECOMPRESS", "true").lower() in ("0", "false", "no"):
+        return StaticFiles(directory=build_path, html=True)
+    global frontend_files
+    frontend_files = PrecompressedStaticFiles(
+        build_path,
+        html=True,
+        cache_bytes=int(os.getenv("FRONTEND_CACHE_MB", "32")) * 1024 * 1024,
+    )
+    return frontend_files
 
 
 # Mount the frontend under /app to not conflict with the LangGraph API routes
@@ -0,0 +1,87 @@
+import asyncio
+import functools
+from collections import Counter
+from contextlib import asynccontextmanager
+from typing import Any, Callable, Dict, Optional, Set
+
+from langchain_core.runnables import RunnableConfig
+
+
+def thread_id_from_config(config: Optional[RunnableConfig]) -> Optional[str]:
+    configurable = (config or {}).get("configurable") or {}
+    thread_id = configurable.get("thread_id")
+    return str(thread_id) if thread_id is not None else None
+
+
+def _run_key(config: Optional[RunnableConfig]) -> Optional[str]:
+    # langgraph-api 把 run_id 放在 configurable 里；直接调用图时退回到 thread id
+    configurable = (config or {}).get("configurable") or {}
+    run_id = configurable.get("run_id")
+    return str(run_id) if run_id is not None else thread_id_from_config(config)
+
+
+class CancellationRegistry:
+    """Account for plans cancelled while one of their nodes was running.
+
+    Cancels go through LangGraph's own run-cancel API
+    (``POST /threads/{thread_id}/runs/{run_id}/cancel``, wrapped by
+    ``POST /plans/{thread_id}/cancel``) or come from a client disconnect when
+    the run is streamed with ``on_disconnect="cancel"`` (the frontend sets it
+    on every submit). Either way the server cancels the run's task on
+    whichever replica executes it, so in-flight ``ainvoke`` calls on the LLM
+    and the ToolNode are aborted with ``CancelledError``. Guarded nodes let
+    it propagate, so the run ends as interrupted (or cancelled) rather than
+    as an error, and keeps its last checkpoint: running the thread again
+    with ``input=None`` resumes the plan. Tool calls run as LangGraph tasks,
+    so results that finished before the cancel are in the checkpoint and the
+    resumed tool step does not call AMap again.
+
+    The registry only counts aborted nodes and the LLM calls the cancel
+    saved; concurrent nodes of the same run count as one cancelled run.
+    """
+
+    def __init__(self, remaining_llm_calls: Callable[[Dict[str, Any]], int] = lambda state: 0):
+        self.remaining_llm_calls = remaining_llm_calls
+        self._tasks: Dict[str, Set[asyncio.Task]] = {}
+        self._counted: Set[str] = set()
+        self._stats: Counter = Counter()
+        self._nodes_cancelled: Counter = Counter()
+
+    def metrics(self) -> Dict[str, Any]:
+        return {**self._stats, "inflight_nodes_cancelled": dict(self._nodes_cancelled)}
+
+    @asynccontextmanager
+    async def track(self, run_key: Optional[str], node: str, state: Dict[str, Any]):
+        """Count the current node as cancelled if its run is cancelled while it runs."""
+        if run_key is None:
+            yield
+            return
+        task = asyncio.current_task()
+        self._tasks.setdefault(run_key, set()).add(task)
+        try:
+            yield
+        except asyncio.CancelledError:
+            self._nodes_cancelled[node] += 1
+            # 同一个 run 里并行的节点会一起被取消，只统计一次
+            if run_key not in self._counted:
+                self._counted.add(run_key)
+                self._stats["runs_cancelled"] += 1
+                self._stats["estimated_llm_calls_saved"] += self.remaining_llm_calls(state)
+            raise
+        finally:
+            tasks = self._tasks.get(run_key)
+            if tasks is not None:
+                tasks.discard(task)
+                if not tasks:
+                    self._tasks.pop(run_key, None)
+                    self._counted.discard(run_key)
+
+    def guard(self, node: str, fn: Callable) -> Callable:
+        """Wrap an async graph node so a cancellation of its run is counted."""
+
+        @functools.wraps(fn)
+        async def wrapper(state, config: RunnableConfig):
+            async with self.track(_run_key(config), node, state):
+                return await fn(state, config)
+
+        return wrapper
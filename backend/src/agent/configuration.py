@@ -1,6 +1,6 @@
 import os
-from pydantic import BaseModel, Field
-from typing import Any, Optional, Dict, ClassVar
+from pydantic import BaseModel, Field, field_validator
+from typing import Any, Optional, Dict, ClassVar, List
 from dotenv import load_dotenv
 from langchain_core.runnables import RunnableConfig
 load_dotenv()
@@ -28,12 +28,50 @@ class Configuration(BaseModel):
     )
 
     answer_model: str = Field(
-        default="gemini-2.0-flash",
+        default="gemini-2.5-flash",
         metadata={
             "description": "The name of the language model to use for the agent's answer."
         },
     )
 
+    tool_selection_model: str = Field(
+        default="gemini-2.5-flash-lite",
+        metadata={
+            "description": "The small, fast model used for classification and tool-selection turns."
+        },
+    )
+
+    agent_model: str = Field(
+        default="gemini-2.5-flash",
+        metadata={
+            "description": "The stronger model the agent escalates to when the tool-selection model produces invalid tool calls or stalls."
+        },
+    )
+
+    hedge_requests: bool = Field(
+        default=True,
+        metadata={
+            "description": "Whether agent and final-answer calls fire a backup request when the primary is slower than usual."
+        },
+    )
+
+    hedge_model: str = Field(
+        default="",
+        metadata={
+            "description": "The model for backup requests, prefix with 'openai:' for OpenAI. Empty uses the primary model."
+        },
+    )
+
+    hedge_percentile: float = Field(
+        default=0.95,
+        metadata={"description": "The primary latency percentile after which a backup request is fired."},
+    )
+
+    hedge_budget_ratio: float = Field(
+        default=0.1,
+        metadata={"description": "The maximum fraction of requests that may be hedged."},
+    )
+
     number_of_initial_queries: int = Field(
         default=3,
         metadata={"description": "The number of initial search queries to generate."},
@@ -46,6 +84,44 @@ class Configuration(BaseModel):
         metadata={"description": "The maximum number of research loops to perform."},
     )
 
+    enable_web_research: bool = Field(
+        default=False,
+        metadata={
+            "description": "Whether to run Google-Search-grounded research (visa rules, ticket prices, festivals) alongside the first agent turn of the AMap loop."
+        },
+    )
+
+    web_research_model: str = Field(
+        default="gemini-2.5-flash",
+        metadata={"description": "The Gemini model used for the grounded web research queries."},
+    )
+
+    use_prompt_cache: bool = Field(
+        default=True,
+        metadata={
+            "description": "Whether to cache the static agent prompt and tool schemas with Gemini context caching."
+        },
+    )
+
+    prompt_cache_ttl_seconds: int = Field(
+        default=3600,
+        metadata={"description": "How long a cached agent prompt prefix lives before it must be refreshed."},
+    )
+
+    tool_allowlist: Optional[List[str]] = Field(
+        default=None,
+        metadata={
+            "description": "Names of the AMap tools the agent may bind (comma separated in the environment). All tools are allowed when unset."
+        },
+    )
+
+    @field_validator("tool_allowlist", mode="before")
+    @classmethod
+    def _split_tool_allowlist(cls, value: Any) -> Any:
+        if isinstance(value, str):
+            return [name.strip() for name in value.split(",") if name.strip()]
+        return value
+
     @classmethod
     def from_runnable_config(
         cls, config: Optional[RunnableConfig] = None
@@ -1,27 +1,30 @@
+import asyncio
 import os
 import logging
 import uuid
 import time
 import json
 
-from agent.tools_and_schemas import SearchQueryList, Reflection, LocationInfo, TravelPlan
+from agent.tools_and_schemas import SearchQueryList, Reflection, LocationInfo, TravelPlan, RefinementScope
 from dotenv import load_dotenv
-from langchain_core.messages import BaseMessage, HumanMessage, AIMessage, SystemMessage
+from langchain_core.messages import BaseMessage, HumanMessage, AIMessage, SystemMessage, ToolMessage
+from langgraph.func import task
 from langgraph.types import Send
 from langgraph.graph import StateGraph
 from langgraph.graph import START, END
 from langgraph.prebuilt import ToolNode, tools_condition
 from langchain_core.runnables import RunnableConfig
-from google.genai import Client
-from langchain.agents import AgentExecutor, create_openai_functions_agent
 from langchain_core.tools import StructuredTool
 from langchain_core.prompts import ChatPromptTemplate
 from langchain_mcp_adapters.client import MultiServerMCPClient
 from agent.state import (
+    NEW_PLAN,
+    merge_token_usage,
     OverallState,
     LocationInfoState,
     ReflectionState,
     LocationSearchState,
+    WebSearchState,
 )
 from agent.configuration import Configuration
 from agent.prompts import (
@@ -29,23 +32,55 @@ from agent.prompts import (
     get_target_date,
     location_info_instructions,
     location_search_instructions,
+    location_search_context,
     reflection_instructions,
     answer_instructions,
+    refinement_scope_instructions,
+    refinement_tool_instructions,
+    refinement_answer_instructions,
+    web_searcher_instructions,
+    web_research_topics,
+    web_research_context,
 )
-from langchain_google_genai import ChatGoogleGenerativeAI
-from langchain_openai import ChatOpenAI
 from agent.utils import (
+    get_citations,
     get_research_topic,
+    insert_citation_markers,
+    resolve_urls,
+)
+from agent.prompt_cache import token_usage
+from agent.tool_selection import ToolSelector, planning_phase
+from agent.routing import get_chat_model, routing_step, stall_reason, tool_call_errors
+from agent.cancellation import thread_id_from_config
+from agent.quota import QuotaExceeded
+from agent.runtime import (
+    amap_quota,
+    cancellations,
+    genai_client,
+    hedger,
+    poi_backend,
+    prewarm_cache,
+    prompt_cache,
+    structured_repair,
+)
+from agent.refinement import (
+    PLAN_SECTIONS,
+    POI_KEYWORDS,
+    build_refinement_report,
+    collect_poi_outputs,
+    current_plan,
+    normalize_sections,
+    partial_plan_model,
+    split_cached_results,
+    tool_succeeded,
+    tools_for_sections,
 )
 
-load_dotenv()
+logger = logging.getLogger(__name__)
 
+load_dotenv()
 
-if os.getenv("GEMINI_API_KEY") is None:
-    raise ValueError("GEMINI_API_KEY is not set")
 
-# Used for Google Search API
-genai_client = Client(api_key=os.getenv("GEMINI_API_KEY"))
 amap_client = MultiServerMCPClient({
     "amap": {
         "transport": "streamable_http",
@@ -107,15 +142,14 @@ def get_tools() -> list[StructuredTool]:
     if _CACHED_TOOLS is None:
         _initialize_tools_cache()
     return _CACHED_TOOLS or []
-tools = get_tools()
+tools = get_tools() + (poi_backend.local_tools() if poi_backend else [])
 tool_node = ToolNode(tools) # <--- 直接用 ToolNode 创建节点
-llm = ChatGoogleGenerativeAI(
-        model="gemini-2.5-flash",
-        temperature=1.0,
-        max_retries=2,
-        api_key=os.getenv("GEMINI_API_KEY"),
-    )
-LLM_WITH_TOOLS = llm.bind_tools(tools)
+_default_config = Configuration.from_runnable_config()
+llm = get_chat_model(_default_config.agent_model)
+# 按规划阶段绑定最小的工具子集，绑定好的模型按子集缓存
+tool_selector = ToolSelector(tools)
+tool_selector.prebuild(get_chat_model(_default_config.tool_selection_model), _default_config.tool_allowlist)
+tool_selector.prebuild(llm, _default_config.tool_allowlist)
 
 # Nodes
 async def check_location_info(state: OverallState, config: RunnableConfig) -> LocationInfoState:
@@ -125,16 +159,66 @@ async def check_location_info(state: OverallState, config: RunnableConfig) -> Lo
     if state.get("initial_search_query_count") is None:
         state["initial_search_query_count"] = configurable.number_of_initial_queries
 
-    structured_llm = llm.with_structured_output(LocationInfo)
-
     # Format the prompt
     current_date = get_current_date()
     formatted_prompt = location_info_instructions.format(
         research_topic=get_research_topic(state["messages"]),
     )
-    # Generate the search queries
-    result = structured_llm.invoke(formatted_prompt)
-    return {"is_location_info": result.is_location_info, "is_date_info": result.is_date_info, "location": result.location, "date": result.date}
+    # 简单的分类任务交给小模型
+    result, step = await _structured_call(
+        "check_location_info", "cheap", configurable.tool_selection_model, LocationInfo, formatted_prompt,
+        optional={"date": ""},
+    )
+    return {"is_location_info": result.is_location_info, "is_date_info": result.is_date_info, "location": result.location, "date": result.date, "model_steps": [NEW_PLAN, step], "token_usage": _step_usage(step, new_plan=True)}
+
+
+async def _structured_call(
+    node: str,
+    tier: str,
+    model: str,
+    schema,
+    prompt: str,
+    configurable: Configuration | None = None,
+    optional: dict | None = None,
+):
+    """调用结构化输出并记录使用的模型档位和成本，传入 configurable 时启用对冲请求
+
+    输出格式有误时在本地修复；optional 中的字段缺失时直接使用给定的默认值
+    """
+    def call(model_name: str, output_schema=schema, text: str = prompt):
+        return get_chat_model(model_name).with_structured_output(output_schema, include_raw=True).ainvoke(text)
+
+    if configurable is not None and configurable.hedge_requests:
+        result = await hedger.ainvoke(
+            f"{node}:{model}",
+            lambda: call(model),
+            lambda: call(configurable.hedge_model or model),
+            # 能在本地修复的结果也算有效，避免为格式问题触发整份重新生成
+            is_valid=lambda r: structured_repair.is_salvageable(schema, r),
+            percentile=configurable.hedge_percentile,
+            budget_ratio=configurable.hedge_budget_ratio,
+        )
+    else:
+        result = await call(model)
+    parsed, extra = await structured_repair.arepair(
+        node, schema, result, prompt, lambda sub_schema, text: call(model, sub_schema, text), optional
+    )
+    usage = token_usage(result["raw"])
+    for message in extra:
+        usage = merge_token_usage(usage, token_usage(message))
+    return parsed, routing_step(node, tier, model, usage)
+
+
+def _step_usage(step: dict, new_plan: bool = False) -> dict:
+    """把一步的成本记录转成 token_usage 的累加项；new_plan 时从这一步重新计数"""
+    usage = {
+        "llm_calls": 1,
+        "input_tokens": step["input_tokens"],
+        "cached_input_tokens": step["cached_input_tokens"],
+        "uncached_input_tokens": step["input_tokens"] - step["cached_input_tokens"],
+        "output_tokens": step["output_tokens"],
+    }
+    return {NEW_PLAN: True, **usage} if new_plan else usage
 
 def continue_to_location_research(state: LocationInfoState) -> str:
     if not state.get("is_location_info"):
@@ -142,20 +226,23 @@ def continue_to_location_research(state: LocationInfoState) -> str:
     else:
         return "start_agent_loop" 
 
-def prepare_agent_loop(state: LocationInfoState) -> OverallState:
+async def prepare_agent_loop(state: LocationInfoState) -> OverallState:
     """将预处理的结果格式化为Agent循环的初始输入"""
     location = state.get("location")
     date = state.get("date")
     if not date:
         date = f"{get_current_date()} to {get_target_date()}"
-    
+    await prewarm_cache.arecord_plan(location, date)
+    # 有预热好的骨架时直接带着其中仍然新鲜的工具结果进入 Agent 循环；实时的工具调用不读预热结果
+    seeded_messages, seeded_results = await prewarm_cache.aseed_plan(location)
+
     return {
-        "messages": [HumanMessage(content=location_search_instructions.format(
+        "messages": [HumanMessage(content=location_search_context.format(
             current_date=get_current_date(),
             date=date,
             location=location
-        )), HumanMessage(content=f"目的地: {location}, 日期: {date}")],
-        "mcp_result": [],
+        ))] + seeded_messages,
+        "mcp_result": seeded_results,
         "best_time": "",
         "suggested_budget": "",
         "view_points": "",
@@ -164,91 +251,438 @@ def prepare_agent_loop(state: LocationInfoState) -> OverallState:
         "transportation": "",
         "tips": "",
         "weather": "",
-        "overall_plan": ""
+        "overall_plan": "",
+        "location": location,
+        "date": date,
+        "refinement_report": {},
+        "web_research_result": [NEW_PLAN],
+        "sources_gathered": [NEW_PLAN],
+    }
+
+
+def fan_out_research(state: OverallState, config: RunnableConfig) -> list:
+    """联网搜索分支和第一轮 Agent 调用在同一步执行；搜索分支默认关闭
+
+    图按步推进，搜索没有结束前工具调用不会开始，所以搜索只和第一轮 Agent 调用重叠，
+    最慢的一次搜索会计入规划延迟
+    """
+    configurable = Configuration.from_runnable_config(config)
+    if not configurable.enable_web_research:
+        return ["agent"]
+    topics = web_research_topics[: configurable.number_of_initial_queries]
+    return ["agent"] + [
+        Send("web_research", {"search_query": topic.format(location=state["location"], date=state["date"]), "id": str(idx)})
+        for idx, topic in enumerate(topics)
+    ]
+
+
+async def web_research(state: WebSearchState, config: RunnableConfig) -> dict:
+    """用 Google 搜索查询签证、门票、节庆等需要最新资料的信息，并插入引用标记"""
+    configurable = Configuration.from_runnable_config(config)
+    model = configurable.web_research_model
+    prompt = web_searcher_instructions.format(
+        current_date=get_current_date(),
+        research_topic=state["search_query"],
+    )
+    try:
+        response = await genai_client.aio.models.generate_content(
+            model=model,
+            contents=prompt,
+            config={"tools": [{"google_search": {}}], "temperature": 0},
+        )
+    except Exception as e:
+        # 搜索分支是可选的，失败时不影响 AMap 规划
+        logger.warning("Error running web research for %s: %s", state["search_query"], e)
+        return {}
+    candidate = response.candidates[0] if response.candidates else None
+    metadata = getattr(candidate, "grounding_metadata", None)
+    resolved_urls = resolve_urls(getattr(metadata, "grounding_chunks", None) or [], state["id"])
+    citations = get_citations(response, resolved_urls)
+    # grounding 的 segment 下标是 UTF-8 字节偏移
+    modified_text = insert_citation_markers(response.text or "", citations, byte_offsets=True)
+
+    usage_metadata = response.usage_metadata
+    usage = {
+        "llm_calls": 1,
+        "input_tokens": getattr(usage_metadata, "prompt_token_count", 0) or 0,
+        "output_tokens": getattr(usage_metadata, "candidates_token_count", 0) or 0,
+    }
+    return {
+        "web_research_result": [modified_text],
+        "sources_gathered": [segment for citation in citations for segment in citation["segments"]],
+        "token_usage": usage,
+        "model_steps": [routing_step("web_research", "research", model, usage)],
     }
 
+async def _invoke_agent_model(
+    phase: str, model: str, phase_tools: list, messages: list, configurable: Configuration
+) -> AIMessage:
+    """调用 agent 模型，慢于平时的请求会被对冲
+
+    延迟按阶段和模型分别统计：写最终回答的回合比选工具的回合慢得多，混在一起会让分位数失真
+    """
+    if not configurable.hedge_requests:
+        return await _call_agent_model(model, phase_tools, messages, configurable)
+    backup_model = configurable.hedge_model or model
+    return await hedger.ainvoke(
+        f"agent:{phase}:{model}",
+        lambda: _call_agent_model(model, phase_tools, messages, configurable),
+        # 备用请求直接内联前缀，不依赖主模型的缓存
+        lambda: _call_agent_model(backup_model, phase_tools, messages, configurable, use_cache=False),
+        is_valid=lambda r: not r.invalid_tool_calls,
+        percentile=configurable.hedge_percentile,
+        budget_ratio=configurable.hedge_budget_ratio,
+    )
+
+
+async def _call_agent_model(
+    model: str, phase_tools: list, messages: list, configurable: Configuration, use_cache: bool = True
+) -> AIMessage:
+    """调用 agent 模型，优先使用缓存的静态前缀"""
+    model_llm = get_chat_model(model)
+    if use_cache and configurable.use_prompt_cache and not model.startswith("openai:"):
+        cached_content = await prompt_cache.aget(
+            model, location_search_instructions, phase_tools, configurable.prompt_cache_ttl_seconds
+        )
+        if cached_content:
+            try:
+                # 前缀（系统提示词和工具）已在缓存中，只发送对话部分
+                return await model_llm.ainvoke(
+                    messages, {"recursion_limit": 100}, cached_content=cached_content
+                )
+            except Exception as e:
+                if "cache" not in str(e).lower():
+                    raise
+                logger.warning("Prompt cache %s rejected, sending prefix inline: %s", cached_content, e)
+                prompt_cache.invalidate(cached_content)
+    return await tool_selector.bind(model_llm, phase_tools).ainvoke(
+        [SystemMessage(content=location_search_instructions), *messages],
+        {"recursion_limit": 100},
+    )
+
+
 async def agent_node(state: OverallState, config: RunnableConfig) -> dict:
     """Agent的大脑，决定下一步行动"""
-    print("---AGENT NODE---")
-    response = await LLM_WITH_TOOLS.ainvoke(state['messages'], {"recursion_limit": 100})
-    return {"messages": [response]}
+    configurable = Configuration.from_runnable_config(config)
+    phase = planning_phase(state.get("mcp_result"))
+    phase_tools = tool_selector.for_phase(phase, configurable.tool_allowlist)
+    if not phase_tools and phase != "finalize":
+        phase_tools = tool_selector.select(tool_selector.tools, configurable.tool_allowlist)
+    print(f"---AGENT NODE ({phase}: {', '.join(t.name for t in phase_tools) or 'no tools'})---")
+
+    usage: dict = {}
+    steps = []
+    escalation = ""
+    if phase != "finalize":
+        # 选工具的回合先交给小模型，只有调用无效或停滞时才升级
+        model = configurable.tool_selection_model
+        response = await _invoke_agent_model(phase, model, phase_tools, state["messages"], configurable)
+        step_usage = token_usage(response)
+        usage = merge_token_usage(usage, step_usage)
+        errors = tool_call_errors(response, phase_tools)
+        escalation = "; ".join(errors) or stall_reason(state["messages"], response, phase) or ""
+        steps.append(routing_step("agent", "cheap", model, step_usage, escalation))
+    if phase == "finalize" or escalation:
+        # 写最终回答用 answer 模型；小模型选工具失败时升级到 agent 模型
+        if escalation:
+            model, tier = configurable.agent_model, "strong"
+        else:
+            model, tier = configurable.answer_model, "answer"
+        response = await _invoke_agent_model(phase, model, phase_tools, state["messages"], configurable)
+        step_usage = token_usage(response)
+        usage = merge_token_usage(usage, step_usage)
+        steps.append(routing_step("agent", tier, model, step_usage, escalation and "escalated"))
+    return {"messages": [response], "token_usage": usage, "model_steps": steps}
 
 
-async def logging_tool_node(state: OverallState) -> dict:
+async def logging_tool_node(state: OverallState, config: RunnableConfig) -> dict:
     last_message = state['messages'][-1]
     
     # 确保是AI消息并且有工具调用
     if not isinstance(last_message, AIMessage) or not last_message.tool_calls:
         return {}
         
-    conversation_id = uuid.uuid4() 
-    
+    thread_id = thread_id_from_config(config)
     start_time = time.time()
-    result = await tool_node.ainvoke(state)
+    result = {"messages": await asyncio.gather(
+        *(_run_tool_call(thread_id, tool_call) for tool_call in last_message.tool_calls)
+    )}
     end_time = time.time()
-    
-    # 记录每一次工具调用的详细信息
-    for i, tool_call in enumerate(last_message.tool_calls):
-        log_entry = {
+
+    # 返回新的列表而不是原地修改 state，否则这些记录不会写入 checkpoint
+    entries = _tool_log_entries(last_message.tool_calls, result, end_time - start_time)
+    return {**result, "mcp_result": (state.get("mcp_result") or []) + entries}
+
+
+@task
+async def _run_tool_call(thread_id: str | None, tool_call: dict):
+    """单独执行一个工具调用
+
+    作为 LangGraph task 运行，结果会单独写入 checkpoint：节点被取消时已完成的调用
+    保留在 checkpoint 中，恢复同一个 thread 时直接返回，不会再次调用 AMap
+    """
+    local = poi_backend.answer(tool_call["name"], tool_call["args"]) if poi_backend else None
+    if local is not None:
+        return ToolMessage(content=local, name=tool_call["name"], tool_call_id=tool_call["id"])
+    try:
+        await amap_quota.acquire(tool_call["name"], thread_id)
+    except QuotaExceeded as e:
+        # 和 ToolNode 的错误处理一样把错误交给模型，而不是中断整个规划
+        return ToolMessage(
+            content=f"Error: {e}", name=tool_call["name"], tool_call_id=tool_call["id"], status="error"
+        )
+    result = await tool_node.ainvoke({"messages": [AIMessage(content="", tool_calls=[tool_call])]})
+    return result["messages"][0]
+
+
+async def prewarm_tool_call(tool_name: str, args: dict) -> str | None:
+    """预热任务调用工具，走 AMap 限额里单独的 prewarm 会话"""
+    local = poi_backend.answer(tool_name, args) if poi_backend else None
+    if local is not None:
+        return local
+    try:
+        await amap_quota.acquire(tool_name, "prewarm")
+    except QuotaExceeded as e:
+        logger.info("Skipping pre-warm of %s: %s", tool_name, e)
+        return None
+    tool_call = {"name": tool_name, "args": args, "id": f"prewarm-{uuid.uuid4().hex[:12]}", "type": "tool_call"}
+    result = await tool_node.ainvoke({"messages": [AIMessage(content="", tool_calls=[tool_call])]})
+    message = result["messages"][0]
+    return None if message.status == "error" else message.content
+
+
+def _tool_log_entries(tool_calls: list, result: dict, latency_s: float) -> list[dict]:
+    """记录每一次工具调用的详细信息"""
+    conversation_id = uuid.uuid4()
+    return [
+        {
             "conversation_id": conversation_id,
             "tool_name": tool_call['name'],
             "tool_input": tool_call['args'],
             "tool_output": result['messages'][i].content, # ToolNode的返回结果是ToolMessage列表
-            "status": "success",
-            "latency_ms": round((end_time - start_time) * 1000, 2)
+            "status": result['messages'][i].status, # 限额拒绝和工具报错时为 "error"
+            "latency_ms": round(latency_s * 1000, 2)
         }
-        if state["mcp_result"] is None:
-            state["mcp_result"] = []
-        state["mcp_result"].append(log_entry)
-    return result
+        for i, tool_call in enumerate(tool_calls)
+    ]
     
 
 async def finalize_answer(state: OverallState, config: RunnableConfig):
-    mcp_result = state["mcp_result"]
-    food = []
-    hotel = []
-    for mcp_item in mcp_result:
-        if mcp_item["tool_name"] == "maps_around_search":
-            if mcp_item["tool_input"]["keywords"] == "美食":
-                food.append(mcp_item["tool_output"])
-            elif mcp_item["tool_input"]["keywords"] == "酒店":
-                hotel.append(mcp_item["tool_output"])
-    result = await llm.with_structured_output(TravelPlan).ainvoke(state["messages"][-1].content)
+    food, hotel = collect_poi_outputs(state["mcp_result"])
+    configurable = Configuration.from_runnable_config(config)
+    prompt = state["messages"][-1].content
+    research = state.get("web_research_result") or []
+    if research:
+        prompt += web_research_context.format(research="\n\n---\n\n".join(research))
+    result, step = await _structured_call(
+        "finalize_answer", "answer", configurable.answer_model, TravelPlan, prompt,
+        configurable,
+        # food / hotel 会被 AMap 的搜索结果覆盖，缺失时不必重新生成
+        optional={"food": "", "hotel": ""},
+    )
     print("result------------->", result)
     
     # 将Pydantic模型转换为字典，然后序列化
     result_dict = result.model_dump() if hasattr(result, 'model_dump') else result.dict()
-    
+
+    # 把引用里的短链接换回原始网址，只保留计划中实际引用到的来源
+    used_sources = []
+    for source in state.get("sources_gathered") or []:
+        short_link, full_link = f"({source.get('short_url')})", f"({source.get('value')})"
+        if source.get("short_url") and any(short_link in value for value in result_dict.values()):
+            result_dict = {key: value.replace(short_link, full_link) for key, value in result_dict.items()}
+            used_sources.append(source)
+
+
     return {
     
         "food": food,
         "hotel": hotel,
-        "best_time": result.best_time,
-        "suggested_budget": result.suggested_budget,
-        "view_points": result.view_points,
-        "transportation": result.transportation,
-        "tips": result.tips,
-        "weather": result.weather,
-        "overall_plan": result.overall_plan,
+        "best_time": result_dict["best_time"],
+        "suggested_budget": result_dict["suggested_budget"],
+        "view_points": result_dict["view_points"],
+        "transportation": result_dict["transportation"],
+        "tips": result_dict["tips"],
+        "weather": result_dict["weather"],
+        "overall_plan": result_dict["overall_plan"],
+        "sources_gathered": [NEW_PLAN, *used_sources],
+        # 最后一次生成也计入本次规划的缓存 / 非缓存输入 token
+        "token_usage": _step_usage(step),
+        "model_steps": [step],
+    }
+
+
+def route_follow_up(state: OverallState) -> str:
+    """已有计划的追问走增量规划，否则走完整流程"""
+    if state.get("overall_plan") and state.get("location"):
+        return "refine"
+    return "plan"
+
+
+def _follow_up_text(messages: list) -> str:
+    for message in reversed(messages):
+        if isinstance(message, HumanMessage):
+            return message.content
+    return ""
+
+
+async def classify_refinement(state: OverallState, config: RunnableConfig) -> dict:
+    """判断追问影响计划的哪些部分"""
+    formatted_prompt = refinement_scope_instructions.format(
+        location=state["location"],
+        date=state.get("date", ""),
+        sections=", ".join(PLAN_SECTIONS),
+        follow_up=_follow_up_text(state["messages"]),
+    )
+    configurable = Configuration.from_runnable_config(config)
+    result, step = await _structured_call(
+        "classify_refinement", "cheap", configurable.tool_selection_model, RefinementScope, formatted_prompt
+    )
+    affected = normalize_sections(result.affected_sections)
+    refresh = [s for s in normalize_sections(result.refresh_sections) if s in affected]
+    update = {
+        "refinement_scope": {
+            "is_refinement": result.is_refinement and bool(affected),
+            "affected_sections": affected,
+            "refresh_sections": refresh,
+        },
+        "model_steps": [NEW_PLAN, step],
+        # 追问是新的一轮，token 从分类这一步重新计数
+        "token_usage": _step_usage(step, new_plan=True),
     }
+    if result.date:
+        update["date"] = result.date
+    return update
+
+
+def continue_refinement(state: OverallState) -> str:
+    if state["refinement_scope"].get("is_refinement"):
+        return "refine"
+    return "replan"
+
+
+async def refine_tools(state: OverallState, config: RunnableConfig) -> dict:
+    """只重新执行受影响部分需要的工具调用，其余结果复用上一次的 checkpoint"""
+    scope = state["refinement_scope"]
+    refresh = scope["refresh_sections"]
+    reused, stale = split_cached_results(state.get("mcp_result") or [], refresh)
+    tool_names = tools_for_sections(refresh)
+    configurable = Configuration.from_runnable_config(config)
+    refresh_tools = tool_selector.select(tool_names, configurable.tool_allowlist)
+    if not refresh_tools:
+        return {"mcp_result": reused + stale}
+
+    formatted_prompt = refinement_tool_instructions.format(
+        location=state["location"],
+        date=state.get("date", ""),
+        follow_up=_follow_up_text(state["messages"]),
+        stale_calls="\n".join(
+            f"- {e['tool_name']}: {json.dumps(e['tool_input'], ensure_ascii=False)}"
+            for e in stale
+        ) or "- 无",
+        sections=", ".join(refresh),
+    )
+    response = await tool_selector.bind(
+        get_chat_model(configurable.tool_selection_model), refresh_tools
+    ).ainvoke(formatted_prompt)
+    step = routing_step(
+        "refine_tools", "cheap", configurable.tool_selection_model, token_usage(response)
+    )
+    tool_calls = [c for c in response.tool_calls if c["name"] in tool_names]
+    if not tool_calls:
+        # 模型没有给出新的调用时保留旧结果，而不是丢掉数据
+        return {"mcp_result": reused + stale, "model_steps": [step], "token_usage": _step_usage(step)}
+
+    thread_id = thread_id_from_config(config)
+    start_time = time.time()
+    result = {"messages": await asyncio.gather(
+        *(_run_tool_call(thread_id, tool_call) for tool_call in tool_calls)
+    )}
+    entries = _tool_log_entries(tool_calls, result, time.time() - start_time)
+    return {
+        "mcp_result": reused + entries,
+        "refinement_scope": {**scope, "tool_calls_run": len(entries)},
+        "model_steps": [step],
+        "token_usage": _step_usage(step),
+    }
+
+
+async def refine_answer(state: OverallState, config: RunnableConfig) -> dict:
+    """只重新生成受影响的 TravelPlan 字段"""
+    scope = state["refinement_scope"]
+    affected = scope["affected_sections"]
+    mcp_result = state["mcp_result"]
+    tool_calls_run = scope.get("tool_calls_run", 0)
+    refreshed = mcp_result[len(mcp_result) - tool_calls_run:]
+    update: dict = {}
+
+    llm_sections = [s for s in affected if s not in POI_KEYWORDS]
+    if llm_sections:
+        formatted_prompt = refinement_answer_instructions.format(
+            current_date=get_current_date(),
+            follow_up=_follow_up_text(state["messages"]),
+            plan=json.dumps(current_plan(state), ensure_ascii=False, indent=2),
+            information="\n".join(
+                f"{e['tool_name']}: {e['tool_output']}" for e in refreshed if tool_succeeded(e)
+            ) or "None",
+        )
+        configurable = Configuration.from_runnable_config(config)
+        result, step = await _structured_call(
+            "refine_answer", "answer", configurable.answer_model, partial_plan_model(llm_sections), formatted_prompt
+        )
+        update.update(result.model_dump())
+        update["model_steps"] = [step]
+        update["token_usage"] = _step_usage(step)
+
+    if any(s in POI_KEYWORDS for s in affected):
+        food, hotel = collect_poi_outputs(mcp_result)
+        if "food" in affected:
+            update["food"] = food
+        if "hotel" in affected:
+            update["hotel"] = hotel
+
+    update["refinement_report"] = build_refinement_report(
+        affected,
+        tool_calls_run=tool_calls_run,
+        tool_calls_reused=len(mcp_result) - tool_calls_run,
+    )
+    return update
 
 
 builder = StateGraph(OverallState, config_schema=Configuration)
 
-builder.add_node("check_location_info", check_location_info)
-builder.add_node("agent", agent_node) 
-builder.add_node("tool_executor", logging_tool_node) 
+# 调用 LLM 或工具的节点都可以被取消
+builder.add_node("check_location_info", cancellations.guard("check_location_info", check_location_info))
+builder.add_node("agent", cancellations.guard("agent", agent_node)) 
+builder.add_node("tool_executor", cancellations.guard("tool_executor", logging_tool_node)) 
 builder.add_node("prepare_agent_loop", prepare_agent_loop)
 builder.add_node("end_without_plan", lambda state: {"messages": [AIMessage("抱歉，我需要明确的地点信息才能为您规划。")]})
-builder.add_node("finalize_answer", finalize_answer)
+builder.add_node("finalize_answer", cancellations.guard("finalize_answer", finalize_answer))
+builder.add_node("web_research", cancellations.guard("web_research", web_research))
+builder.add_node("classify_refinement", cancellations.guard("classify_refinement", classify_refinement))
+builder.add_node("refine_tools", cancellations.guard("refine_tools", refine_tools))
+builder.add_node("refine_answer", cancellations.guard("refine_answer", refine_answer))
 
-builder.add_edge(START, "check_location_info")
+builder.add_conditional_edges(
+    START,
+    route_follow_up,
+    {"refine": "classify_refinement", "plan": "check_location_info"},
+)
+builder.add_conditional_edges(
+    "classify_refinement",
+    continue_refinement,
+    {"refine": "refine_tools", "replan": "check_location_info"},
+)
+builder.add_edge("refine_tools", "refine_answer")
+builder.add_edge("refine_answer", END)
 builder.add_conditional_edges(
     "check_location_info",
     continue_to_location_research,
     {"start_agent_loop": "prepare_agent_loop", "end_without_plan": "end_without_plan"},
 )
-builder.add_edge("prepare_agent_loop", "agent")
+# 联网搜索和第一轮 Agent 调用同一步执行，下一步开始前结果已经写入 state
+builder.add_conditional_edges("prepare_agent_loop", fan_out_research, ["agent", "web_research"])
+builder.add_edge("web_research", END)
 builder.add_conditional_edges(
     "agent",
     tools_condition, 
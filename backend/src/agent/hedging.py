@@ -0,0 +1,163 @@
+import asyncio
+import time
+from collections import deque
+from dataclasses import dataclass, field
+from typing import Any, Awaitable, Callable, Deque, Dict, Optional, TypeVar
+
+T = TypeVar("T")
+
+
+@dataclass
+class HedgeStats:
+    """Latency samples and hedge counters for one kind of request."""
+
+    latencies: Deque[float] = field(default_factory=lambda: deque(maxlen=200))
+    requests: int = 0
+    hedged: int = 0
+    hedge_wins: int = 0
+    primary_wins: int = 0
+    fallbacks: int = 0
+    budget_denied: int = 0
+    failures: int = 0
+
+    def percentile(self, p: float) -> Optional[float]:
+        if not self.latencies:
+            return None
+        ordered = sorted(self.latencies)
+        return ordered[min(int(p * len(ordered)), len(ordered) - 1)]
+
+    def as_dict(self) -> Dict[str, Any]:
+        p50, p95 = self.percentile(0.5), self.percentile(0.95)
+        return {
+            "requests": self.requests,
+            "hedged": self.hedged,
+            "hedge_wins": self.hedge_wins,
+            "primary_wins": self.primary_wins,
+            "fallbacks": self.fallbacks,
+            "budget_denied": self.budget_denied,
+            "failures": self.failures,
+            "p50_ms": round(p50 * 1000, 1) if p50 is not None else None,
+            "p95_ms": round(p95 * 1000, 1) if p95 is not None else None,
+        }
+
+
+class HedgeBudget:
+    """Retry-budget style limit: every request earns ``ratio`` hedge tokens."""
+
+    def __init__(self, max_tokens: float = 5.0):
+        self.max_tokens = max_tokens
+        self.tokens = 0.0
+
+    def deposit(self, ratio: float) -> None:
+        self.tokens = min(self.tokens + ratio, self.max_tokens)
+
+    def try_spend(self) -> bool:
+        if self.tokens >= 1.0:
+            self.tokens -= 1.0
+            return True
+        return False
+
+
+class HedgedInvoker:
+    """Fire a backup request when the primary is slower than its usual tail.
+
+    The primary request starts immediately. If it has not finished once the
+    configured latency percentile has elapsed (and the hedge budget allows
+    it) a backup request is started; the first valid result wins and the
+    other request is cancelled. A primary that fails or returns an invalid
+    result falls back to the backup right away, independent of the budget.
+    """
+
+    def __init__(self, min_samples: int = 20, default_delay_s: float = 8.0, min_delay_s: float = 0.5):
+        self.min_samples = min_samples
+        self.default_delay_s = default_delay_s
+        self.min_delay_s = min_delay_s
+        self.budget = HedgeBudget()
+        self._stats: Dict[str, HedgeStats] = {}
+
+    def stats(self, key: str) -> HedgeStats:
+        return self._stats.setdefault(key, HedgeStats())
+
+    def metrics(self) -> Dict[str, Dict[str, Any]]:
+        return {key: stats.as_dict() for key, stats in self._stats.items()}
+
+    def hedge_delay(self, key: str, percentile: float) -> float:
+        stats = self.stats(key)
+        if len(stats.latencies) < self.min_samples:
+            return self.default_delay_s
+        return max(stats.percentile(percentile), self.min_delay_s)
+
+    async def ainvoke(
+        self,
+        key: str,
+        primary: Callable[[], Awaitable[T]],
+        backup: Callable[[], Awaitable[T]],
+        is_valid: Callable[[T], bool] = lambda result: True,
+        percentile: float = 0.95,
+        budget_ratio: float = 0.1,
+    ) -> T:
+        """Run ``primary`` and hedge it with ``backup``; return the first valid result."""
+        stats = self.stats(key)
+        stats.requests += 1
+        self.budget.deposit(budget_ratio)
+        delay = self.hedge_delay(key, percentile)
+        start = time.monotonic()
+
+        tasks: Dict[asyncio.Future, str] = {asyncio.ensure_future(primary()): "primary"}
+        hedge_decided = False
+        backup_started = False
+        first_error: Optional[BaseException] = None
+        last_invalid: Any = None
+        has_invalid = False
+        try:
+            while tasks:
+                timeout = None if hedge_decided else max(delay - (time.monotonic() - start), 0)
+                done, _ = await asyncio.wait(
+                    tasks, timeout=timeout, return_when=asyncio.FIRST_COMPLETED
+                )
+                if not done:
+                    # 主请求超过了延迟分位数，预算允许时发出备用请求
+                    hedge_decided = True
+                    if self.budget.try_spend():
+                        stats.hedged += 1
+                        backup_started = True
+                        tasks[asyncio.ensure_future(backup())] = "backup"
+                    else:
+                        stats.budget_denied += 1
+                    continue
+
+                for task in done:
+                    role = tasks.pop(task)
+                    try:
+                        result = task.result()
+                    except Exception as e:
+                        first_error = first_error or e
+                    else:
+                        if role == "primary":
+                            # 只记录主请求自己的延迟，备用请求获胜时不能把分位数拉低
+                            stats.latencies.append(time.monotonic() - start)
+                        if is_valid(result):
+                            if role == "primary":
+                                stats.primary_wins += 1
+                            else:
+                                stats.hedge_wins += 1
+                            return result
+                        last_invalid, has_invalid = result, True
+
+                    if not backup_started:
+                        # 主请求失败或结果无效，立即退回到备用请求
+                        hedge_decided = True
+                        backup_started = True
+                        stats.fallbacks += 1
+                        tasks[asyncio.ensure_future(backup())] = "backup"
+
+            stats.failures += 1
+            if has_invalid:
+                return last_invalid
+            raise first_error
+        finally:
+            for task, role in tasks.items():
+                if role == "primary":
+                    # 被取消的主请求至少花了这么久
+                    stats.latencies.append(time.monotonic() - start)
+                task.cancel()
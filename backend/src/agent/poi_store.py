@@ -0,0 +1,482 @@
+import json
+import logging
+import math
+import mmap
+import os
+import struct
+import time
+from array import array
+from bisect import bisect_left, bisect_right
+from collections import Counter
+from dataclasses import dataclass
+from typing import Any, Dict, Iterable, List, Optional, Sequence, Tuple
+
+from langchain_core.tools import BaseTool, StructuredTool
+
+logger = logging.getLogger(__name__)
+
+MAGIC = b"POIS"
+VERSION = 2
+# 空间索引的网格大小（度），约 1.1 公里
+CELL_DEGREES = 0.01
+_ALIGN = 8
+_EARTH_RADIUS_M = 6371000.0
+# 能从离线快照回答的 AMap 工具；天气等实时数据始终走在线接口
+LOCAL_TOOL_NAMES = ("maps_text_search", "maps_around_search", "maps_geo")
+# 搜索关键词的同义词 -> 快照里的类别名；其余关键词必须和类别名完全一致
+CATEGORY_ALIASES: Dict[str, str] = {
+    "餐厅": "美食",
+    "餐馆": "美食",
+    "餐饮": "美食",
+    "小吃": "美食",
+    "住宿": "酒店",
+    "宾馆": "酒店",
+    "旅馆": "酒店",
+    "景区": "景点",
+    "旅游景点": "景点",
+}
+# 字符串列: (偏移数组, UTF-8 数据)
+_STRING_COLUMNS = {
+    "name": ("name_offsets", "names"),
+    "address": ("address_offsets", "addresses"),
+    "id": ("id_offsets", "ids"),
+}
+
+
+@dataclass
+class PoiRecord:
+    """One POI row of a city snapshot."""
+
+    city: str
+    category: str
+    name: str
+    lon: float
+    lat: float
+    rating: float = 0.0
+    address: str = ""
+    poi_id: str = ""
+
+
+@dataclass
+class MonthlyClimate:
+    """Long-term monthly climate norm for a city."""
+
+    high_c: float
+    low_c: float
+    precipitation_mm: float
+
+
+def _cell_key(category_id: int, lon: float, lat: float) -> int:
+    lat_idx = int(math.floor((lat + 90) / CELL_DEGREES))
+    lon_idx = int(math.floor((lon + 180) / CELL_DEGREES))
+    return (category_id << 48) | (lat_idx << 24) | lon_idx
+
+
+def _haversine_m(lon1: float, lat1: float, lon2: float, lat2: float) -> float:
+    phi1, phi2 = math.radians(lat1), math.radians(lat2)
+    d_phi = phi2 - phi1
+    d_lambda = math.radians(lon2 - lon1)
+    a = math.sin(d_phi / 2) ** 2 + math.cos(phi1) * math.cos(phi2) * math.sin(d_lambda / 2) ** 2
+    return 2 * _EARTH_RADIUS_M * math.asin(math.sqrt(a))
+
+
+def _parse_location(location: str) -> Optional[Tuple[float, float]]:
+    try:
+        lon, lat = (float(part) for part in str(location).split(",")[:2])
+    except (TypeError, ValueError):
+        return None
+    return lon, lat
+
+
+def _string_column(values: Sequence[str]) -> Tuple[array, bytes]:
+    offsets = array("I", [0])
+    blob = bytearray()
+    for value in values:
+        blob += value.encode("utf-8")
+        offsets.append(len(blob))
+    return offsets, bytes(blob)
+
+
+def build_poi_store(
+    path: str,
+    pois: Iterable[PoiRecord],
+    climate: Optional[Dict[str, List[Optional[MonthlyClimate]]]] = None,
+) -> int:
+    """Write a columnar POI snapshot with category/spatial indexes; return the row count.
+
+    Rows are sorted by (category, grid cell) so every cell of a category is
+    one contiguous row range. A second index lists row ids sorted by
+    (city, category, rating desc) for city-wide category searches, and a
+    third one sorted by (city, name) for exact name lookups.
+    """
+    climate = climate or {}
+    pois = [p for p in pois if p.name and -180 <= p.lon <= 180 and -90 <= p.lat <= 90]
+    cities = sorted({p.city for p in pois} | set(climate))
+    categories = sorted({p.category for p in pois})
+    city_ids = {name: i for i, name in enumerate(cities)}
+    category_ids = {name: i for i, name in enumerate(categories)}
+
+    pois.sort(key=lambda p: (_cell_key(category_ids[p.category], p.lon, p.lat), -p.rating))
+    n = len(pois)
+
+    cell_keys, cell_starts = array("q"), array("I")
+    for row, poi in enumerate(pois):
+        key = _cell_key(category_ids[poi.category], poi.lon, poi.lat)
+        if not cell_keys or cell_keys[-1] != key:
+            cell_keys.append(key)
+            cell_starts.append(row)
+    cell_starts.append(n)
+
+    city_order = sorted(
+        range(n),
+        key=lambda r: (city_ids[pois[r].city], category_ids[pois[r].category], -pois[r].rating),
+    )
+    city_rows = array("I", city_order)
+    city_keys, city_starts = array("I"), array("I")
+    for pos, row in enumerate(city_order):
+        key = (city_ids[pois[row].city] << 16) | category_ids[pois[row].category]
+        if not city_keys or city_keys[-1] != key:
+            city_keys.append(key)
+            city_starts.append(pos)
+    city_starts.append(n)
+
+    name_rows = array("I", sorted(range(n), key=lambda r: (city_ids[pois[r].city], pois[r].name)))
+
+    nan = float("nan")
+    climate_values = array("f")
+    for city in cities:
+        months = climate.get(city) or []
+        for month in range(12):
+            norm = months[month] if month < len(months) else None
+            if norm is not None:
+                climate_values.extend([norm.high_c, norm.low_c, norm.precipitation_mm])
+            else:
+                climate_values.extend([nan, nan, nan])
+
+    name_offsets, names = _string_column([p.name for p in pois])
+    address_offsets, addresses = _string_column([p.address for p in pois])
+    id_offsets, ids = _string_column([p.poi_id for p in pois])
+    sections: List[Tuple[str, str, bytes]] = [
+        ("lon", "f", array("f", [p.lon for p in pois]).tobytes()),
+        ("lat", "f", array("f", [p.lat for p in pois]).tobytes()),
+        ("rating", "f", array("f", [p.rating for p in pois]).tobytes()),
+        ("category", "H", array("H", [category_ids[p.category] for p in pois]).tobytes()),
+        ("city", "H", array("H", [city_ids[p.city] for p in pois]).tobytes()),
+        ("name_offsets", "I", name_offsets.tobytes()),
+        ("names", "B", names),
+        ("address_offsets", "I", address_offsets.tobytes()),
+        ("addresses", "B", addresses),
+        ("id_offsets", "I", id_offsets.tobytes()),
+        ("ids", "B", ids),
+        ("cell_keys", "q", cell_keys.tobytes()),
+        ("cell_starts", "I", cell_starts.tobytes()),
+        ("city_rows", "I", city_rows.tobytes()),
+        ("city_keys", "I", city_keys.tobytes()),
+        ("city_starts", "I", city_starts.tobytes()),
+        ("name_rows", "I", name_rows.tobytes()),
+        ("climate", "f", climate_values.tobytes()),
+    ]
+
+    header = {"rows": n, "cities": cities, "categories": categories, "sections": {}}
+    # 先算出各段的偏移，再写入；每段按 8 字节对齐以便直接 cast 成类型化视图
+    header_size = 4096
+    while True:
+        offset = header_size
+        for name, fmt, data in sections:
+            header["sections"][name] = [offset, len(data), fmt]
+            offset += len(data) + (-len(data) % _ALIGN)
+        encoded = json.dumps(header, ensure_ascii=False).encode("utf-8")
+        if len(encoded) + 12 <= header_size:
+            break
+        header_size *= 2
+
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(MAGIC + struct.pack("<II", VERSION, len(encoded)) + encoded)
+        f.write(b"\0" * (header_size - 12 - len(encoded)))
+        for _, _, data in sections:
+            f.write(data)
+            f.write(b"\0" * (-len(data) % _ALIGN))
+    os.replace(tmp_path, path)
+    return n
+
+
+def records_from_amap(city: str, category: str, response: Dict[str, Any]) -> List[PoiRecord]:
+    """Convert an AMap place search response into snapshot rows."""
+    records = []
+    for poi in response.get("pois") or []:
+        location = _parse_location(poi.get("location", ""))
+        if location is None:
+            continue
+        rating = (poi.get("biz_ext") or {}).get("rating") or poi.get("rating") or 0
+        try:
+            rating = float(rating)
+        except (TypeError, ValueError):
+            rating = 0.0
+        address = poi.get("address")
+        records.append(
+            PoiRecord(
+                city=city,
+                category=category,
+                name=str(poi.get("name") or ""),
+                lon=location[0],
+                lat=location[1],
+                rating=rating,
+                address=address if isinstance(address, str) else "",
+                poi_id=str(poi.get("id") or ""),
+            )
+        )
+    return records
+
+
+class PoiStore:
+    """Read-only, memory-mapped view of a POI snapshot built by ``build_poi_store``."""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._file = open(path, "rb")
+        self._mmap = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        if self._mmap[:4] != MAGIC:
+            raise ValueError(f"{path} is not a POI store")
+        version, header_len = struct.unpack_from("<II", self._mmap, 4)
+        if version != VERSION:
+            raise ValueError(f"{path} has unsupported POI store version {version}")
+        header = json.loads(self._mmap[12 : 12 + header_len].decode("utf-8"))
+        self.rows: int = header["rows"]
+        self.cities: List[str] = header["cities"]
+        self.categories: List[str] = header["categories"]
+        self._city_ids = {name: i for i, name in enumerate(self.cities)}
+        self._category_ids = {name: i for i, name in enumerate(self.categories)}
+        view = memoryview(self._mmap)
+        self._columns: Dict[str, Any] = {
+            name: view[offset : offset + length].cast(fmt)
+            for name, (offset, length, fmt) in header["sections"].items()
+        }
+
+    def close(self) -> None:
+        for column in self._columns.values():
+            column.release()
+        self._mmap.close()
+        self._file.close()
+
+    def _string(self, column: str, row: int) -> str:
+        offsets_name, blob_name = _STRING_COLUMNS[column]
+        offsets = self._columns[offsets_name]
+        return bytes(self._columns[blob_name][offsets[row] : offsets[row + 1]]).decode("utf-8")
+
+    def poi(self, row: int, distance_m: Optional[float] = None) -> Dict[str, Any]:
+        """Return a row in the shape of an AMap POI."""
+        c = self._columns
+        poi = {
+            "id": self._string("id", row),
+            "name": self._string("name", row),
+            "address": self._string("address", row),
+            "location": f"{c['lon'][row]:.6f},{c['lat'][row]:.6f}",
+            "type": self.categories[c["category"][row]],
+            "cityname": self.cities[c["city"][row]],
+            "rating": round(c["rating"][row], 1),
+        }
+        if distance_m is not None:
+            poi["distance"] = str(round(distance_m))
+        return poi
+
+    def match_category(self, keywords: str) -> Optional[str]:
+        """Map search keywords to a snapshot category by exact name or alias, if any."""
+        keywords = (keywords or "").strip()
+        if not keywords:
+            return None
+        if keywords in self._category_ids:
+            return keywords
+        category = CATEGORY_ALIASES.get(keywords)
+        return category if category in self._category_ids else None
+
+    def has_city(self, city: str) -> bool:
+        return self._city_for(city) is not None
+
+    def _city_for(self, city: str) -> Optional[int]:
+        city = (city or "").strip()
+        if city in self._city_ids:
+            return self._city_ids[city]
+        # 允许 “成都” 和 “成都市” 互相匹配
+        stripped = city.removesuffix("市")
+        for name, city_id in self._city_ids.items():
+            if name.removesuffix("市") == stripped:
+                return city_id
+        return None
+
+    def search_city(self, city: str, category: str, limit: int = 10) -> Optional[List[Dict[str, Any]]]:
+        """Top-rated POIs of a category in a city, or None when not in the snapshot."""
+        city_id, category_id = self._city_for(city), self._category_ids.get(category)
+        if city_id is None or category_id is None:
+            return None
+        keys, starts = self._columns["city_keys"], self._columns["city_starts"]
+        i = bisect_left(keys, (city_id << 16) | category_id)
+        if i == len(keys) or keys[i] != (city_id << 16) | category_id:
+            return None
+        rows = self._columns["city_rows"][starts[i] : min(starts[i + 1], starts[i] + limit)]
+        return [self.poi(row) for row in rows]
+
+    def search_around(
+        self, lon: float, lat: float, category: str, radius_m: float = 3000, limit: int = 10
+    ) -> Optional[List[Dict[str, Any]]]:
+        """POIs of a category within ``radius_m``, best rated first; None when outside the snapshot."""
+        category_id = self._category_ids.get(category)
+        if category_id is None:
+            return None
+        c = self._columns
+        keys, starts = c["cell_keys"], c["cell_starts"]
+        lat_span = math.ceil(radius_m / 111320 / CELL_DEGREES)
+        lon_span = math.ceil(radius_m / (111320 * max(math.cos(math.radians(lat)), 0.01)) / CELL_DEGREES)
+        center = _cell_key(category_id, lon, lat)
+        lat_idx, lon_idx = (center >> 24) & 0xFFFFFF, center & 0xFFFFFF
+        found = []
+        for d_lat in range(-lat_span, lat_span + 1):
+            row_prefix = (category_id << 48) | ((lat_idx + d_lat) << 24)
+            # 同一纬度行的网格在 key 上是连续的，一次二分查出整段
+            lo = bisect_left(keys, row_prefix | max(lon_idx - lon_span, 0))
+            hi = bisect_right(keys, row_prefix | (lon_idx + lon_span))
+            if lo == hi:
+                continue
+            for row in range(starts[lo], starts[hi]):
+                distance = _haversine_m(lon, lat, c["lon"][row], c["lat"][row])
+                if distance <= radius_m:
+                    found.append((row, distance))
+        if not found:
+            # 附近没有快照数据时交给在线接口
+            return None
+        found.sort(key=lambda item: (-c["rating"][item[0]], item[1]))
+        return [self.poi(row, distance) for row, distance in found[:limit]]
+
+    def geocode(self, name: str, city: str = "") -> Optional[Dict[str, Any]]:
+        """Exact POI name lookup, optionally restricted to a city."""
+        name = (name or "").strip()
+        if not name:
+            return None
+        name_rows, city_column = self._columns["name_rows"], self._columns["city"]
+        city_ids = [self._city_for(city)] if city else range(len(self.cities))
+        for city_id in city_ids:
+            if city_id is None:
+                continue
+            # 按 (城市, 名称) 排好序的索引上二分，只解码 O(log n) 个名称
+            i = bisect_left(name_rows, (city_id, name), key=lambda row: (city_column[row], self._string("name", row)))
+            if i < len(name_rows) and city_column[name_rows[i]] == city_id and self._string("name", name_rows[i]) == name:
+                return self.poi(name_rows[i])
+        return None
+
+    def climate_norms(self, city: str) -> Optional[List[Dict[str, Any]]]:
+        """Monthly climate norms for ``city``, or None when the snapshot has none."""
+        city_id = self._city_for(city)
+        if city_id is None:
+            return None
+        values = self._columns["climate"][city_id * 36 : city_id * 36 + 36]
+        months = []
+        for month in range(12):
+            high, low, precipitation = values[month * 3 : month * 3 + 3]
+            if math.isnan(high):
+                continue
+            months.append(
+                {
+                    "month": month + 1,
+                    "avg_high_c": round(high, 1),
+                    "avg_low_c": round(low, 1),
+                    "precipitation_mm": round(precipitation, 1),
+                }
+            )
+        return months or None
+
+
+class LocalPoiBackend:
+    """Serve stable AMap queries from a ``PoiStore`` before calling the live tools.
+
+    Only category searches (text and around search) and exact POI geocoding
+    are answered locally; real-time data such as ``maps_weather`` always goes
+    to AMap, as does every query the snapshot cannot answer. Local answers
+    skip the MCP round trip and do not draw from the AMap quota.
+    """
+
+    def __init__(self, store: PoiStore):
+        self.store = store
+        self._stats: Counter = Counter()
+        self._lookup_us_total = 0.0
+
+    def metrics(self) -> Dict[str, Any]:
+        lookups = sum(v for k, v in self._stats.items() if k.endswith((":hit", ":miss")))
+        return {
+            **self._stats,
+            "rows": self.store.rows,
+            "cities": len(self.store.cities),
+            "avg_lookup_us": round(self._lookup_us_total / lookups, 1) if lookups else 0.0,
+        }
+
+    def lookup(self, tool_name: str, args: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        """Answer a tool call from the snapshot, or None on a miss."""
+        start = time.perf_counter()
+        result = self._lookup(tool_name, args)
+        self._lookup_us_total += (time.perf_counter() - start) * 1e6
+        self._stats[f"{tool_name}:{'hit' if result is not None else 'miss'}"] += 1
+        return result
+
+    def _lookup(self, tool_name: str, args: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        store = self.store
+        if tool_name == "maps_text_search":
+            category = store.match_category(args.get("keywords", ""))
+            pois = store.search_city(args.get("city", ""), category) if category else None
+            return {"pois": pois} if pois else None
+        if tool_name == "maps_around_search":
+            category = store.match_category(args.get("keywords", ""))
+            location = _parse_location(args.get("location", ""))
+            if category is None or location is None:
+                return None
+            radius = float(args.get("radius") or 3000)
+            pois = store.search_around(*location, category, radius_m=radius)
+            return {"pois": pois} if pois else None
+        if tool_name == "climate_norms":
+            months = store.climate_norms(args.get("city", ""))
+            return {"months": months} if months else None
+        if tool_name == "maps_geo":
+            poi = store.geocode(args.get("address", ""), args.get("city", ""))
+            if poi is None:
+                return None
+            return {
+                "results": [
+                    {"country": "中国", "city": poi["cityname"], "location": poi["location"], "level": "兴趣点"}
+                ]
+            }
+        return None
+
+    def answer(self, tool_name: str, args: Dict[str, Any]) -> Optional[str]:
+        """Return a ToolMessage body for a call the snapshot can serve, or None to go live."""
+        if tool_name not in LOCAL_TOOL_NAMES and tool_name != "climate_norms":
+            return None
+        result = self.lookup(tool_name, args)
+        if result is None:
+            if tool_name == "climate_norms":
+                # 本地专用工具没有在线接口可回退
+                return json.dumps({"error": f"no climate norms for {args.get('city', '')}"}, ensure_ascii=False)
+            return None
+        return json.dumps({**result, "source": "offline_snapshot"}, ensure_ascii=False)
+
+    def local_tools(self) -> List[BaseTool]:
+        """Tools that only exist locally; their calls are always answered by ``answer``."""
+
+        async def climate_norms(city: str) -> str:
+            return self.answer("climate_norms", {"city": city})
+
+        return [
+            StructuredTool.from_function(
+                coroutine=climate_norms,
+                name="climate_norms",
+                description="查询城市各月的气候常态（平均最高/最低气温和降水量），用于判断最佳游览时间。",
+            )
+        ]
+
+
+def load_local_backend(path: Optional[str]) -> Optional[LocalPoiBackend]:
+    """Open the snapshot at ``path`` if it exists."""
+    if not path or not os.path.isfile(path):
+        return None
+    try:
+        return LocalPoiBackend(PoiStore(path))
+    except (OSError, ValueError) as e:
+        logger.warning("Error opening POI store %s, using live AMap only: %s", path, e)
+        return None
@@ -0,0 +1,474 @@
+import asyncio
+import json
+import logging
+import math
+import os
+import re
+import time
+import uuid
+from collections import Counter
+from dataclasses import asdict, dataclass, field
+from datetime import datetime, timedelta
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple
+
+from langchain_core.messages import AIMessage, BaseMessage, ToolMessage
+
+logger = logging.getLogger(__name__)
+
+# 骨架里各工具结果的有效期（秒）：天气几个小时就会变，过期后规划只重新查询天气，其余结果照常复用
+DEFAULT_TTLS: Dict[str, float] = {
+    "maps_weather": 3 * 3600,
+    "maps_text_search": 24 * 3600,
+    "maps_geo": 7 * 24 * 3600,
+    "maps_around_search": 24 * 3600,
+}
+# 预热骨架里查询的景点数量
+SKELETON_VIEW_POINTS = 3
+_DATE_PATTERNS = (
+    re.compile(r"(?P<year>\d{4})[-/年](?P<month>\d{1,2})"),
+    re.compile(r"(?P<month>\d{1,2})月"),
+)
+
+DemandKey = Tuple[str, str]
+
+
+def normalize_location(location: str) -> str:
+    return (location or "").strip().removesuffix("市")
+
+
+def date_window(date: str, today: Optional[datetime] = None) -> str:
+    """Bucket a free-form travel date into the month it starts in (``YYYY-MM``)."""
+    today = today or datetime.now()
+    for pattern in _DATE_PATTERNS:
+        match = pattern.search(date or "")
+        if match is None:
+            continue
+        month = int(match.group("month"))
+        if not 1 <= month <= 12:
+            continue
+        if "year" in match.groupdict():
+            year = int(match.group("year"))
+        else:
+            # 只写了月份时取最近的一次
+            year = today.year + (1 if month < today.month else 0)
+        return f"{year:04d}-{month:02d}"
+    return "unspecified"
+
+
+class DemandTracker:
+    """Exponentially decayed request counts per (destination, date window)."""
+
+    def __init__(self, half_life_hours: float = 24.0, max_keys: int = 5000):
+        self.decay = math.log(2) / (half_life_hours * 3600)
+        self.max_keys = max_keys
+        self._scores: Dict[DemandKey, Tuple[float, float]] = {}
+
+    def _score(self, key: DemandKey, now: float) -> float:
+        score, updated = self._scores.get(key, (0.0, now))
+        return score * math.exp(-self.decay * (now - updated))
+
+    def record(self, location: str, date: str) -> DemandKey:
+        now = time.time()
+        key = (normalize_location(location), date_window(date))
+        self._scores[key] = (self._score(key, now) + 1.0, now)
+        if len(self._scores) > self.max_keys:
+            # 丢掉最冷的一半
+            ranked = sorted(self._scores, key=lambda k: self._score(k, now))
+            for cold in ranked[: len(ranked) // 2]:
+                self._scores.pop(cold, None)
+        return key
+
+    def top(self, n: int) -> List[Tuple[DemandKey, float]]:
+        now = time.time()
+        ranked = sorted(((k, self._score(k, now)) for k in self._scores), key=lambda item: -item[1])
+        return ranked[:n]
+
+
+class RedisDemandLog:
+    """Request log in Redis, shared by every replica and kept across restarts.
+
+    Each day's plan requests are counted in a sorted set keyed by the day;
+    ``atop`` decays the counts of the last ``lookback_days`` days by age, so
+    the ranking matches ``DemandTracker`` at day granularity.
+    """
+
+    def __init__(self, client, half_life_hours: float = 24.0, lookback_days: int = 7, prefix: str = "prewarm-demand"):
+        self.client = client
+        self.half_life_hours = half_life_hours
+        self.lookback_days = lookback_days
+        self.prefix = prefix
+
+    def _day_key(self, day: datetime) -> str:
+        return f"{self.prefix}:{day:%Y%m%d}"
+
+    async def arecord(self, location: str, date: str) -> DemandKey:
+        key = (normalize_location(location), date_window(date))
+        day_key = self._day_key(datetime.now())
+        pipe = self.client.pipeline()
+        pipe.zincrby(day_key, 1, "|".join(key))
+        pipe.expire(day_key, (self.lookback_days + 1) * 86400)
+        # 任意副本上最近一次开始规划的时间，预热任务据此判断整个集群是否空闲
+        pipe.set(f"{self.prefix}:last-plan", time.time(), ex=86400)
+        await pipe.execute()
+        return key
+
+    async def alast_plan_at(self) -> Optional[float]:
+        last = await self.client.get(f"{self.prefix}:last-plan")
+        return float(last) if last is not None else None
+
+    async def atop(self, n: int) -> List[Tuple[DemandKey, float]]:
+        now = datetime.now()
+        pipe = self.client.pipeline()
+        for age in range(self.lookback_days):
+            pipe.zrange(self._day_key(now - timedelta(days=age)), 0, -1, withscores=True)
+        scores: Dict[DemandKey, float] = {}
+        for age, members in enumerate(await pipe.execute()):
+            # 按天衰减：今天的请求权重为 1，每过一个半衰期减半
+            weight = 0.5 ** (age * 24 / self.half_life_hours)
+            for member, count in members:
+                location, _, window = (member.decode() if isinstance(member, bytes) else member).partition("|")
+                scores[(location, window)] = scores.get((location, window), 0.0) + count * weight
+        return sorted(scores.items(), key=lambda item: -item[1])[:n]
+
+
+@dataclass
+class PlanSkeleton:
+    """Tool results gathered ahead of time for a destination."""
+
+    location: str
+    entries: List[Dict[str, Any]]
+    built_at: float = field(default_factory=time.time)
+
+
+# 持有者相同时续期，否则只在没人持有时获取
+_LEADER_LUA = """
+local current = redis.call('GET', KEYS[1])
+if current == false or current == ARGV[1] then
+  redis.call('SET', KEYS[1], ARGV[1], 'PX', ARGV[2])
+  return 1
+end
+return 0
+"""
+_RELEASE_LUA = """
+if redis.call('GET', KEYS[1]) == ARGV[1] then
+  return redis.call('DEL', KEYS[1])
+end
+return 0
+"""
+
+
+class RedisSkeletonStore:
+    """Plan skeletons and the warm-cycle leader lock in Redis, shared by every replica."""
+
+    def __init__(self, client, prefix: str = "prewarm"):
+        self.client = client
+        self.prefix = prefix
+        self._lead = client.register_script(_LEADER_LUA)
+        self._release = client.register_script(_RELEASE_LUA)
+
+    def _key(self, location: str) -> str:
+        return f"{self.prefix}:skeleton:{normalize_location(location)}"
+
+    async def aget(self, location: str) -> Optional[PlanSkeleton]:
+        raw = await self.client.get(self._key(location))
+        return PlanSkeleton(**json.loads(raw)) if raw is not None else None
+
+    async def aput(self, skeleton: PlanSkeleton, ttl_seconds: float) -> None:
+        payload = json.dumps(asdict(skeleton), ensure_ascii=False)
+        await self.client.set(self._key(skeleton.location), payload, ex=max(int(ttl_seconds), 1))
+
+    async def alead(self, owner: str, ttl_seconds: float) -> bool:
+        return bool(await self._lead(keys=[f"{self.prefix}:leader"], args=[owner, int(ttl_seconds * 1000)]))
+
+    async def aresign(self, owner: str) -> None:
+        await self._release(keys=[f"{self.prefix}:leader"], args=[owner])
+
+
+class PrewarmCache:
+    """Plan skeletons filled off-peak by ``PrewarmScheduler``.
+
+    When a skeleton exists for the destination, the agent loop starts with
+    its still-fresh weather, view point, food and hotel results in place,
+    so it skips straight to the phases whose data is missing. Prewarmed
+    results are only used this way; live tool calls, including refinement
+    re-runs, always go to AMap. Skeletons and demand are kept in Redis when
+    configured, so every replica serves the same skeletons and only one of
+    them warms at a time; they fall back to process memory otherwise or
+    while Redis is unreachable.
+    """
+
+    def __init__(
+        self,
+        ttls: Optional[Dict[str, float]] = None,
+        demand_log: Optional[RedisDemandLog] = None,
+        skeleton_store: Optional[RedisSkeletonStore] = None,
+    ):
+        self.ttls = {**DEFAULT_TTLS, **(ttls or {})}
+        self.demand = DemandTracker()
+        self.demand_log = demand_log
+        self.skeleton_store = skeleton_store
+        self._skeletons: Dict[str, PlanSkeleton] = {}
+        self._last_plan_at: Optional[float] = None
+        self._stats: Counter = Counter()
+
+    @classmethod
+    def from_env(cls) -> "PrewarmCache":
+        redis_uri = os.getenv("REDIS_URI")
+        if not redis_uri:
+            return cls()
+        from redis.asyncio import Redis
+
+        client = Redis.from_url(redis_uri, socket_timeout=0.5, socket_connect_timeout=0.5)
+        return cls(demand_log=RedisDemandLog(client), skeleton_store=RedisSkeletonStore(client))
+
+    async def ametrics(self) -> Dict[str, Any]:
+        hot_keys = await self.ahot_keys(10)
+        plans = self._stats["plans"]
+        return {
+            **self._stats,
+            # 冷路径被消除的比例：直接从骨架开始的规划
+            "warm_plan_ratio": round(self._stats["warm_plans"] / plans, 3) if plans else 0.0,
+            "amap_calls_avoided": self._stats["skeleton_tool_calls_reused"],
+            "demand_store": "redis" if self.demand_log is not None else "local",
+            "skeleton_store": "redis" if self.skeleton_store is not None else "local",
+            "hot_keys": [
+                {"location": loc, "window": window, "score": round(score, 2)}
+                for (loc, window), score in hot_keys
+            ],
+        }
+
+    def count(self, name: str, n: int = 1) -> None:
+        self._stats[name] += n
+
+    async def _shared(self, name: str, call: Awaitable, fallback: Any = None) -> Any:
+        """Run a Redis operation; on failure log it, count it and return ``fallback``."""
+        try:
+            return await call
+        except Exception as e:
+            logger.warning("Error in pre-warm %s, using local state: %s", name, e)
+            self._stats["redis_errors"] += 1
+            return fallback
+
+    def _fresh_entries(self, skeleton: PlanSkeleton) -> List[Dict[str, Any]]:
+        age = time.time() - skeleton.built_at
+        return [entry for entry in skeleton.entries if age < self.ttls.get(entry["tool_name"], 0)]
+
+    async def aget_skeleton(self, location: str) -> Optional[PlanSkeleton]:
+        local = self._skeletons.get(normalize_location(location))
+        if self.skeleton_store is None:
+            return local
+        return await self._shared("skeleton read", self.skeleton_store.aget(location), local)
+
+    async def ais_fresh(self, location: str) -> bool:
+        """Whether every result of the destination's skeleton is still within its TTL."""
+        skeleton = await self.aget_skeleton(location)
+        return skeleton is not None and len(self._fresh_entries(skeleton)) == len(skeleton.entries)
+
+    async def astore_skeleton(self, skeleton: PlanSkeleton) -> None:
+        self._skeletons[normalize_location(skeleton.location)] = skeleton
+        self._stats["skeletons_built"] += 1
+        if self.skeleton_store is not None:
+            ttl = max(self.ttls.get(entry["tool_name"], 0) for entry in skeleton.entries)
+            await self._shared("skeleton write", self.skeleton_store.aput(skeleton, ttl))
+
+    async def alead(self, owner: str, ttl_seconds: float) -> bool:
+        """Take or renew the warm-cycle lock; without Redis every process warms on its own."""
+        if self.skeleton_store is None:
+            return True
+        # Redis 不可用时不预热，避免所有副本同时调用 AMap
+        return await self._shared("leader lock", self.skeleton_store.alead(owner, ttl_seconds), False)
+
+    async def aresign(self, owner: str) -> None:
+        if self.skeleton_store is not None:
+            await self._shared("leader lock", self.skeleton_store.aresign(owner))
+
+    async def arecently_planned(self, window_seconds: float) -> bool:
+        """Whether any replica started a plan in the last ``window_seconds``."""
+        last = self._last_plan_at
+        if self.demand_log is not None:
+            shared = await self._shared("demand read", self.demand_log.alast_plan_at())
+            last = max(last or 0.0, shared or 0.0) or None
+        return last is not None and time.time() - last < window_seconds
+
+    async def arecord_plan(self, location: str, date: str) -> None:
+        self._stats["plans"] += 1
+        self._last_plan_at = time.time()
+        if self.demand_log is not None:
+            try:
+                await self.demand_log.arecord(location, date)
+                return
+            except Exception as e:
+                logger.warning("Error recording demand in Redis, counting locally: %s", e)
+                self._stats["demand_log_errors"] += 1
+        self.demand.record(location, date)
+
+    async def ahot_keys(self, n: int) -> List[Tuple[DemandKey, float]]:
+        """Return the ``n`` most requested (destination, date window) keys."""
+        if self.demand_log is not None:
+            try:
+                return await self.demand_log.atop(n)
+            except Exception as e:
+                logger.warning("Error reading demand from Redis, using local counts: %s", e)
+                self._stats["demand_log_errors"] += 1
+        return self.demand.top(n)
+
+    async def aseed_plan(self, location: str) -> Tuple[List[BaseMessage], List[Dict[str, Any]]]:
+        """Return (messages, mcp_result) to start a plan from the skeleton's fresh results, or empty lists."""
+        skeleton = await self.aget_skeleton(location)
+        entries = self._fresh_entries(skeleton) if skeleton is not None else []
+        if not entries:
+            self._stats["cold_plans"] += 1
+            return [], []
+        self._stats["warm_plans"] += 1
+        self._stats["skeleton_tool_calls_reused"] += len(entries)
+        tool_calls = [
+            {"name": entry["tool_name"], "args": entry["tool_input"], "id": f"prewarm-{uuid.uuid4().hex[:12]}", "type": "tool_call"}
+            for entry in entries
+        ]
+        messages: List[BaseMessage] = [AIMessage(content="", tool_calls=tool_calls)]
+        messages += [
+            ToolMessage(content=entry["tool_output"], name=entry["tool_name"], tool_call_id=call["id"])
+            for entry, call in zip(entries, tool_calls)
+        ]
+        conversation_id = uuid.uuid4()
+        mcp_result = [
+            {**entry, "conversation_id": conversation_id, "latency_ms": 0.0} for entry in entries
+        ]
+        return messages, mcp_result
+
+
+def _view_points(text_search_output: str, limit: int) -> List[Tuple[str, str]]:
+    """Pick (name, location) of the first POIs of a text search result."""
+    try:
+        data = json.loads(text_search_output)
+    except (TypeError, ValueError):
+        return []
+    points = []
+    for poi in data.get("pois") or []:
+        if poi.get("name") and poi.get("location"):
+            points.append((poi["name"], poi["location"]))
+    return points[:limit]
+
+
+def _parse_hours(raw: str) -> Tuple[int, int]:
+    start, _, end = raw.partition("-")
+    return int(start), int(end or start)
+
+
+class PrewarmScheduler:
+    """Refresh the hottest destinations off-peak at a fixed tool-call rate.
+
+    Each cycle ranks (destination, date window) keys by decayed demand and
+    rebuilds the skeletons that are missing or stale, following the same
+    gather → locate → enrich steps as the agent loop. Only the replica
+    holding the cache's leader lock warms in a cycle, so AMap usage does
+    not grow with the number of replicas. Warming only runs in the
+    configured off-peak hours, pauses while ``is_busy()`` reports local
+    plans or any replica started a plan in the last ``busy_window_seconds``,
+    and never exceeds ``calls_per_minute`` AMap calls.
+    """
+
+    def __init__(
+        self,
+        cache: PrewarmCache,
+        run_tool: Callable[[str, Dict[str, Any]], Awaitable[Optional[str]]],
+        is_busy: Callable[[], bool] = lambda: False,
+        top_n: int = 50,
+        calls_per_minute: float = 6.0,
+        off_peak_hours: str = "1-7",
+        interval_seconds: float = 300.0,
+        busy_window_seconds: float = 60.0,
+        lock_seconds: float = 900.0,
+    ):
+        self.cache = cache
+        self.run_tool = run_tool
+        self.is_busy = is_busy
+        self.top_n = top_n
+        self.min_call_interval = 60.0 / calls_per_minute
+        self.off_peak = _parse_hours(off_peak_hours)
+        self.interval_seconds = interval_seconds
+        self.busy_window_seconds = busy_window_seconds
+        # 每预热一个目的地续期一次，持有者挂掉后锁自动过期
+        self.lock_seconds = lock_seconds
+        self.owner = uuid.uuid4().hex
+        self._last_call = 0.0
+
+    def in_off_peak(self, now: Optional[datetime] = None) -> bool:
+        hour = (now or datetime.now()).hour
+        start, end = self.off_peak
+        return start <= hour < end if start <= end else hour >= start or hour < end
+
+    async def _call(self, tool_name: str, args: Dict[str, Any]) -> Optional[str]:
+        # 固定速率，并在有实时流量时让路
+        while True:
+            wait = self._last_call + self.min_call_interval - time.monotonic()
+            if wait > 0:
+                await asyncio.sleep(wait)
+            elif self.is_busy() or await self.cache.arecently_planned(self.busy_window_seconds):
+                await asyncio.sleep(self.min_call_interval)
+            else:
+                break
+        self._last_call = time.monotonic()
+        self.cache.count("prewarm_tool_calls")
+        return await self.run_tool(tool_name, args)
+
+    async def build_skeleton(self, location: str) -> Optional[PlanSkeleton]:
+        """Collect the tool results a plan for ``location`` needs."""
+        entries: List[Dict[str, Any]] = []
+
+        async def step(tool_name: str, args: Dict[str, Any]) -> Optional[str]:
+            content = await self._call(tool_name, args)
+            if content is not None:
+                entries.append({"tool_name": tool_name, "tool_input": args, "tool_output": content, "status": "success"})
+            return content
+
+        if await step("maps_weather", {"city": location}) is None:
+            return None
+        search = await step("maps_text_search", {"keywords": "景点", "city": location})
+        points = _view_points(search or "", SKELETON_VIEW_POINTS)
+        if not points:
+            return None
+        for name, _ in points:
+            await step("maps_geo", {"address": name, "city": location})
+        center = points[0][1]
+        for keywords in ("美食", "酒店"):
+            await step("maps_around_search", {"keywords": keywords, "location": center, "radius": "3000"})
+        return PlanSkeleton(location=location, entries=entries)
+
+    async def run_once(self) -> int:
+        """Warm the hottest stale destinations; return how many skeletons were built."""
+        built = 0
+        seen = set()
+        this_month = datetime.now().strftime("%Y-%m")
+        try:
+            for (location, window), _ in await self.cache.ahot_keys(self.top_n):
+                # 行程已经过去的窗口不再预热；同一城市的不同窗口共用一份骨架
+                if window != "unspecified" and window < this_month:
+                    continue
+                if location in seen or await self.cache.ais_fresh(location):
+                    continue
+                seen.add(location)
+                if not self.in_off_peak():
+                    break
+                # 别的副本正在预热（或锁已被接管）时让出这一轮
+                if not await self.cache.alead(self.owner, self.lock_seconds):
+                    self.cache.count("prewarm_cycles_skipped")
+                    break
+                try:
+                    skeleton = await self.build_skeleton(location)
+                except Exception as e:
+                    logger.warning("Error pre-warming %s: %s", location, e)
+                    self.cache.count("prewarm_errors")
+                    continue
+                if skeleton is not None:
+                    await self.cache.astore_skeleton(skeleton)
+                    built += 1
+        finally:
+            await self.cache.aresign(self.owner)
+        return built
+
+    async def run_forever(self) -> None:
+        while True:
+            if self.in_off_peak():
+                await self.run_once()
+            await asyncio.sleep(self.interval_seconds)
@@ -0,0 +1,154 @@
+import asyncio
+import hashlib
+import json
+import logging
+import time
+from dataclasses import dataclass
+from typing import Any, Dict, Optional, Sequence
+
+from google.genai import Client, types
+from langchain_core.messages import AIMessage
+from langchain_core.tools import BaseTool
+from langchain_core.utils.function_calling import convert_to_openai_tool
+from langchain_google_genai._function_utils import (
+    convert_to_genai_function_declarations,
+)
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class _CacheEntry:
+    name: Optional[str]
+    expires_at: float
+    last_used: float
+
+
+class PromptCache:
+    """Gemini explicit context cache for the static agent prefix.
+
+    The prefix is the system prompt plus the bound tool schemas. Each distinct
+    (model, prompt, tools) combination gets its own cached content, which is
+    created lazily, extended before it expires and deleted when it is no
+    longer used. When caching is not possible (e.g. the prefix is below the
+    provider's minimum size) the failure is remembered for a while so the
+    agent simply falls back to sending the prefix inline.
+    """
+
+    def __init__(
+        self,
+        client: Client,
+        refresh_margin_seconds: int = 120,
+        failure_backoff_seconds: int = 600,
+    ):
+        self.client = client
+        self.refresh_margin_seconds = refresh_margin_seconds
+        self.failure_backoff_seconds = failure_backoff_seconds
+        self._entries: Dict[str, _CacheEntry] = {}
+        self._locks: Dict[str, asyncio.Lock] = {}
+
+    @staticmethod
+    def prefix_key(model: str, system_instruction: str, tools: Sequence[BaseTool]) -> str:
+        """Hash everything that makes up the cached prefix."""
+        schemas = [convert_to_openai_tool(tool) for tool in tools]
+        payload = json.dumps(
+            [model, system_instruction, schemas], ensure_ascii=False, sort_keys=True
+        )
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    async def aget(
+        self,
+        model: str,
+        system_instruction: str,
+        tools: Sequence[BaseTool],
+        ttl_seconds: int,
+    ) -> Optional[str]:
+        """Return the cached content name for the prefix, creating it if needed."""
+        key = self.prefix_key(model, system_instruction, tools)
+        lock = self._locks.setdefault(key, asyncio.Lock())
+        async with lock:
+            now = time.time()
+            entry = self._entries.get(key)
+            if entry is not None and entry.expires_at > now:
+                if entry.name is not None and entry.expires_at - now < self.refresh_margin_seconds:
+                    await self._extend(entry, ttl_seconds)
+                entry.last_used = now
+                return entry.name
+
+            if entry is not None and entry.name is not None:
+                # 已过期的缓存在服务端也会被清理，这里只需要忘掉它
+                self._entries.pop(key, None)
+            try:
+                cache = await self.client.aio.caches.create(
+                    model=model,
+                    config=types.CreateCachedContentConfig(
+                        display_name=f"travel-agent-{key[:12]}",
+                        system_instruction=system_instruction,
+                        tools=convert_to_genai_function_declarations(list(tools)) if tools else None,
+                        ttl=f"{ttl_seconds}s",
+                    ),
+                )
+            except Exception as e:
+                logger.warning("Error creating prompt cache, sending prefix inline: %s", e)
+                self._entries[key] = _CacheEntry(
+                    name=None, expires_at=now + self.failure_backoff_seconds, last_used=now
+                )
+                return None
+
+            self._entries[key] = _CacheEntry(
+                name=cache.name, expires_at=now + ttl_seconds, last_used=now
+            )
+            await self.aprune(ttl_seconds)
+            return cache.name
+
+    async def _extend(self, entry: _CacheEntry, ttl_seconds: int) -> None:
+        try:
+            await self.client.aio.caches.update(
+                name=entry.name,
+                config=types.UpdateCachedContentConfig(ttl=f"{ttl_seconds}s"),
+            )
+            entry.expires_at = time.time() + ttl_seconds
+        except Exception as e:
+            logger.warning("Error extending prompt cache %s: %s", entry.name, e)
+
+    def invalidate(self, name: str) -> None:
+        """Forget a cache the provider rejected (expired or deleted server-side)."""
+        for key, entry in list(self._entries.items()):
+            if entry.name == name:
+                self._entries.pop(key, None)
+
+    async def aprune(self, idle_seconds: int) -> None:
+        """Delete caches that have not been used for ``idle_seconds``."""
+        now = time.time()
+        for key, entry in list(self._entries.items()):
+            if now - entry.last_used > idle_seconds:
+                self._entries.pop(key, None)
+                await self._delete(entry.name)
+
+    async def aclose(self) -> None:
+        """Delete every cache created by this process."""
+        for key, entry in list(self._entries.items()):
+            self._entries.pop(key, None)
+            await self._delete(entry.name)
+
+    async def _delete(self, name: Optional[str]) -> None:
+        if name is None:
+            return
+        try:
+            await self.client.aio.caches.delete(name=name)
+        except Exception as e:
+            logger.warning("Error deleting prompt cache %s: %s", name, e)
+
+
+def token_usage(message: AIMessage) -> Dict[str, Any]:
+    """Split the input tokens of a model response into cached and uncached."""
+    usage = getattr(message, "usage_metadata", None) or {}
+    input_tokens = usage.get("input_tokens", 0)
+    cached = (usage.get("input_token_details") or {}).get("cache_read", 0) or 0
+    return {
+        "llm_calls": 1,
+        "input_tokens": input_tokens,
+        "cached_input_tokens": cached,
+        "uncached_input_tokens": max(input_tokens - cached, 0),
+        "output_tokens": usage.get("output_tokens", 0),
+    }
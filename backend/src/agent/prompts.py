@@ -129,11 +129,10 @@ EXAMPLE JSON OUTPUT:
 # """
 
 
+# 静态前缀：不包含任何 format 字段，保证每次请求的前缀完全一致，便于 Gemini 上下文缓存
 location_search_instructions = """ 你是一个世界顶级的旅行规划专家 AI Agent。
 你的任务是根据用户提供的目的地和日期，利用你手上的工具，为用户打造一份详尽、实用且个性化的旅行计划。你应该告诉用户目的地最佳的游览时间，旅行的预算和tips，值得品尝的美食和值得住的酒店。
 
-当前日期是: {current_date}。
-
 **核心指令:**
 你必须遵循以下所有步骤来收集信息，直到你拥有了制定一份完美计划所需要的所有数据。在最终输出那份格式化的旅行计划之前，你**不能**停止工作或进行总结性对话。
 
@@ -141,7 +140,7 @@ location_search_instructions = """ 你是一个世界顶级的旅行规划专家
 1.  **需求分析**: 首先，分析用户的目的地和日期。
 2.  **生成初步景点列表(POI)**: 在内心生成一个武汉值得去的景点候选列表，例如：黄鹤楼、东湖、武汉大学、湖北省博物馆等。这个列表将指导你后续的信息收集。
 3.  **分步信息收集 (强制执行)**: 你必须像一个侦探一样，通过调用工具来逐一收集信息。每完成一步，你都应该在思考下一步需要什么信息。
-    * **第一步**: 调用 `maps_weather` 查询天气。
+    * **第一步**: 调用 `maps_weather` 查询天气。如果可以使用 `climate_norms`，同时调用它获取目的地各月的气候常态，用来判断最佳游览时间。
     * **第二步**: 基于你的POI列表，调用 `maps_geo` 来获取这些景点的精确位置，以便规划路线。
     * **第三步**: 基于景点位置，调用 `maps_around_search` 寻找附近的美食。
     * **第四步**: 再次调用 `maps_around_search` 寻找合适的酒店。
@@ -152,6 +151,11 @@ location_search_instructions = """ 你是一个世界顶级的旅行规划专家
 
 **你的思考过程应该是这样的（内心独白，不要直接输出给用户）:**
 "好的，用户的需求是武汉5日游。天气查完了，是晴天和雷阵雨。接下来我需要获取黄鹤楼、东湖这些景点的坐标。我要调用 `maps_geo`。拿到坐标了，现在我以黄鹤楼为中心，找找附近有什么好吃的，调用 `maps_around_search`..."
+当前日期和用户输入会在下一条消息中给出。
+"""
+
+# 动态后缀：每次规划只有这一小段会变化
+location_search_context = """当前日期是: {current_date}。
 现在，开始工作。
 用户输入: Date: {date} Location: {location}
 """
@@ -173,6 +177,20 @@ Research Topic:
 {research_topic}
 """
 
+# 联网搜索分支的查询主题：只查模型记忆里容易过时的信息
+web_research_topics = (
+    "{location} 旅游签证和入境政策（{date}）",
+    "{location} 主要景点门票价格、预约方式和开放时间（{date}）",
+    "{location} {date} 期间的节庆活动、展会和特殊安排",
+)
+
+web_research_context = """
+
+联网搜索结果（带引用链接）:
+{research}
+
+使用上面的搜索结果补充签证、门票和节庆等信息，引用时保留对应的 Markdown 链接。"""
+
 reflection_instructions = """You are an expert travel assistant analyzing summaries about "{research_topic}".
 
 Instructions:
@@ -221,3 +239,82 @@ User Context:
 
 Information:
 {information}"""
+
+
+refinement_scope_instructions = """Your goal is to decide which parts of an existing travel plan a follow-up request changes.
+
+Instructions:
+- The user already has a travel plan for "{location}" on "{date}".
+- If the follow-up asks for a different destination or an unrelated question, set "is_refinement" to false.
+- Otherwise list in "affected_sections" only the plan sections that must be rewritten. Keep everything else untouched.
+- List in "refresh_sections" only the sections whose map or weather data must be queried again. Reuse the previous data whenever it is still valid (e.g. a cheaper hotel needs a new hotel search, a new date needs new weather, a shorter budget needs no new data).
+- If the follow-up changes the travel date, put the new date in "date", otherwise return an empty string.
+- Valid sections: {sections}
+
+Format:
+- Format your response as a JSON object with ALL of these exact keys:
+   - "is_refinement": true or false
+   - "affected_sections": list of section names
+   - "refresh_sections": list of section names
+   - "date": the new date or ""
+
+Example:
+Follow-up: 换个便宜点的酒店
+EXAMPLE JSON OUTPUT:
+```json
+{{
+    "is_refinement": true,
+    "affected_sections": ["hotel", "suggested_budget", "overall_plan"],
+    "refresh_sections": ["hotel"],
+    "date": ""
+}}
+```
+
+Follow-up:
+{follow_up}
+"""
+
+
+refinement_tool_instructions = """你是一个旅行规划专家 AI Agent，正在根据用户的追问修改一份已有的旅行计划。
+
+目的地: {location}
+日期: {date}
+用户追问: {follow_up}
+
+下面是之前为这些部分调用过的工具，它们的结果已经过期:
+{stale_calls}
+
+请只针对以下部分重新调用工具: {sections}。不要调用其他工具，也不要输出计划内容。
+"""
+
+
+refinement_answer_instructions = """Update an existing travel plan according to the user's follow-up request.
+
+Instructions:
+- The current date is {current_date}.
+- Only rewrite the sections requested in the output format, keep them consistent with the rest of the plan.
+- Use the fresh tool results when they are provided, otherwise rely on the existing plan.
+- Your answer should be in the same language as the existing plan.
+
+Follow-up:
+{follow_up}
+
+Existing plan:
+{plan}
+
+Fresh tool results:
+{information}"""
+
+
+structured_output_fill_instructions = """Part of a structured answer was lost. Produce only the missing fields: {fields}.
+
+Instructions:
+- Base the missing fields on the source content below.
+- Keep them consistent with the fields that were already produced.
+- Answer in the same language as the source content.
+
+Fields already produced:
+{partial}
+
+Source content:
+{source}"""
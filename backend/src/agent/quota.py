@@ -0,0 +1,247 @@
+import asyncio
+import logging
+import os
+import time
+from collections import Counter
+from dataclasses import dataclass, field
+from datetime import datetime
+from typing import Any, Dict, List, Optional, Tuple
+from zoneinfo import ZoneInfo
+
+logger = logging.getLogger(__name__)
+
+# 所有桶和每日计数在一个脚本里检查和扣减，保证多个副本之间是原子的
+_TOKEN_BUCKET_LUA = """
+local now_parts = redis.call('TIME')
+local now = tonumber(now_parts[1]) * 1000 + math.floor(tonumber(now_parts[2]) / 1000)
+local n = #KEYS - 1
+local wait = 0
+local tokens = {}
+for i = 1, n do
+  local rate = tonumber(ARGV[2 * i - 1])
+  local capacity = tonumber(ARGV[2 * i])
+  local bucket = redis.call('HMGET', KEYS[i], 'tokens', 'ts')
+  local current = tonumber(bucket[1]) or capacity
+  local ts = tonumber(bucket[2]) or now
+  current = math.min(capacity, current + math.max(now - ts, 0) / 1000 * rate)
+  tokens[i] = current
+  if current < 1 then
+    wait = math.max(wait, math.ceil((1 - current) / rate * 1000))
+  end
+end
+local daily_limit = tonumber(ARGV[2 * n + 1])
+local used = tonumber(redis.call('GET', KEYS[n + 1]) or '0')
+if daily_limit > 0 and used >= daily_limit then
+  return {-1, 0}
+end
+if wait > 0 then
+  return {0, wait}
+end
+for i = 1, n do
+  local rate = tonumber(ARGV[2 * i - 1])
+  local capacity = tonumber(ARGV[2 * i])
+  redis.call('HSET', KEYS[i], 'tokens', tostring(tokens[i] - 1), 'ts', now)
+  redis.call('PEXPIRE', KEYS[i], math.ceil(capacity / rate * 1000) + 1000)
+end
+redis.call('INCR', KEYS[n + 1])
+redis.call('EXPIRE', KEYS[n + 1], 172800)
+return {1, 0}
+"""
+
+# (key, 每秒速率, 桶容量)
+Bucket = Tuple[str, float, float]
+
+# AMap 的每日配额按北京时间零点重置
+QUOTA_TIMEZONE = ZoneInfo("Asia/Shanghai")
+
+
+class QuotaExceeded(Exception):
+    """Raised when an AMap call cannot be made within the quota."""
+
+
+def _parse_limits(raw: str) -> Dict[str, float]:
+    """Parse ``name=qps,name=qps`` into a dict."""
+    limits = {}
+    for item in raw.split(","):
+        if "=" in item:
+            name, value = item.split("=", 1)
+            limits[name.strip()] = float(value)
+    return limits
+
+
+@dataclass
+class QuotaLimits:
+    """AMap quota limits shared by every replica using the same key."""
+
+    global_qps: float = 3.0
+    daily_limit: int = 5000
+    session_qps: float = 1.0
+    # 一个 agent 回合会并行发出多个调用（例如每个景点各搜一次美食和酒店），会话桶要装得下一整轮
+    session_burst: int = 6
+    tool_qps: Dict[str, float] = field(default_factory=dict)
+    burst_seconds: float = 1.0
+
+    @classmethod
+    def from_env(cls) -> "QuotaLimits":
+        return cls(
+            global_qps=float(os.getenv("AMAP_QPS", "3")),
+            daily_limit=int(os.getenv("AMAP_DAILY_QUOTA", "5000")),
+            session_qps=float(os.getenv("AMAP_SESSION_QPS", "1")),
+            session_burst=int(os.getenv("AMAP_SESSION_BURST", "6")),
+            tool_qps=_parse_limits(os.getenv("AMAP_TOOL_QPS", "")),
+        )
+
+    def buckets(self, tool_name: str, session_id: Optional[str]) -> List[Bucket]:
+        """Return the buckets a call must draw from: global, per tool and per session."""
+        buckets = [("global", self.global_qps, max(self.global_qps * self.burst_seconds, 1))]
+        if tool_name in self.tool_qps:
+            qps = self.tool_qps[tool_name]
+            buckets.append((f"tool:{tool_name}", qps, max(qps * self.burst_seconds, 1)))
+        if session_id is not None:
+            # 公平性：单个会话最多只能用掉 session_qps，避免一个大规划饿死其他会话
+            buckets.append(
+                (
+                    f"session:{session_id}",
+                    self.session_qps,
+                    max(self.session_qps * self.burst_seconds, self.session_burst, 1),
+                )
+            )
+        return buckets
+
+
+def _daily_key() -> str:
+    return f"daily:{datetime.now(QUOTA_TIMEZONE):%Y%m%d}"
+
+
+class RedisQuotaBackend:
+    """Token buckets stored in Redis, shared by all API workers."""
+
+    def __init__(self, client, prefix: str = "amap-quota"):
+        self.client = client
+        self.prefix = prefix
+        self._script = client.register_script(_TOKEN_BUCKET_LUA)
+
+    async def try_acquire(self, buckets: List[Bucket], daily_limit: int) -> Tuple[int, float]:
+        keys = [f"{self.prefix}:{key}" for key, _, _ in buckets]
+        keys.append(f"{self.prefix}:{_daily_key()}")
+        args: List[Any] = []
+        for _, rate, capacity in buckets:
+            args += [rate, capacity]
+        args.append(daily_limit)
+        allowed, wait_ms = await self._script(keys=keys, args=args)
+        return int(allowed), int(wait_ms) / 1000
+
+
+class LocalQuotaBackend:
+    """In-process token buckets, used when Redis is unavailable and in tests.
+
+    ``share`` scales every limit down so that several replicas falling back
+    at the same time still stay within the key's quota.
+    """
+
+    def __init__(self, share: float = 1.0):
+        self.share = share
+        self._buckets: Dict[str, Tuple[float, float]] = {}
+        self._daily: Counter = Counter()
+
+    async def try_acquire(self, buckets: List[Bucket], daily_limit: int) -> Tuple[int, float]:
+        now = time.monotonic()
+        daily_key = _daily_key()
+        if daily_limit > 0 and self._daily[daily_key] >= daily_limit * self.share:
+            return -1, 0.0
+        wait = 0.0
+        refilled = {}
+        for key, rate, capacity in buckets:
+            rate *= self.share
+            capacity = max(capacity * self.share, 1)
+            tokens, ts = self._buckets.get(key, (capacity, now))
+            tokens = min(capacity, tokens + (now - ts) * rate)
+            refilled[key] = tokens
+            if tokens < 1:
+                wait = max(wait, (1 - tokens) / rate)
+        if wait > 0:
+            return 0, wait
+        for key, tokens in refilled.items():
+            self._buckets[key] = (tokens - 1, now)
+        self._daily[daily_key] += 1
+        return 1, 0.0
+
+
+class QuotaGovernor:
+    """Throttle MCP tool calls to the AMap key's cluster-wide quota.
+
+    Calls wait for a token from the global, per-tool and per-session buckets
+    (up to ``max_wait_seconds``). Redis errors switch to the local backend
+    for ``redis_retry_seconds`` before Redis is tried again.
+    """
+
+    def __init__(
+        self,
+        limits: QuotaLimits,
+        backend: Optional[RedisQuotaBackend] = None,
+        fallback: Optional[LocalQuotaBackend] = None,
+        max_wait_seconds: float = 10.0,
+        redis_retry_seconds: float = 30.0,
+    ):
+        self.limits = limits
+        self.backend = backend
+        self.fallback = fallback or LocalQuotaBackend()
+        self.max_wait_seconds = max_wait_seconds
+        self.redis_retry_seconds = redis_retry_seconds
+        self._redis_down_until = 0.0
+        self._stats: Counter = Counter()
+
+    @classmethod
+    def from_env(cls) -> "QuotaGovernor":
+        limits = QuotaLimits.from_env()
+        fallback = LocalQuotaBackend(share=1 / max(int(os.getenv("AMAP_REPLICAS", "1")), 1))
+        redis_uri = os.getenv("REDIS_URI")
+        if not redis_uri:
+            return cls(limits, fallback=fallback)
+        from redis.asyncio import Redis
+
+        client = Redis.from_url(redis_uri, socket_timeout=0.5, socket_connect_timeout=0.5)
+        return cls(limits, backend=RedisQuotaBackend(client), fallback=fallback)
+
+    def metrics(self) -> Dict[str, Any]:
+        return {
+            **self._stats,
+            "backend": "local" if self._using_fallback() else "redis",
+        }
+
+    def _using_fallback(self) -> bool:
+        return self.backend is None or time.monotonic() < self._redis_down_until
+
+    async def _try_acquire(self, buckets: List[Bucket]) -> Tuple[int, float]:
+        if not self._using_fallback():
+            try:
+                return await self.backend.try_acquire(buckets, self.limits.daily_limit)
+            except Exception as e:
+                logger.warning("Error reaching Redis quota store, using local limits: %s", e)
+                self._stats["redis_errors"] += 1
+                self._redis_down_until = time.monotonic() + self.redis_retry_seconds
+        self._stats["local_decisions"] += 1
+        return await self.fallback.try_acquire(buckets, self.limits.daily_limit)
+
+    async def acquire(self, tool_name: str, session_id: Optional[str] = None) -> float:
+        """Wait for quota for one call; return the seconds spent waiting."""
+        buckets = self.limits.buckets(tool_name, session_id)
+        start = time.monotonic()
+        throttled = False
+        while True:
+            allowed, wait = await self._try_acquire(buckets)
+            if allowed == 1:
+                waited = time.monotonic() - start
+                self._stats["acquired"] += 1
+                if throttled:
+                    self._stats["throttled"] += 1
+                    self._stats["wait_ms_total"] += round(waited * 1000)
+                return waited
+            if allowed == -1:
+                self._stats["rejected_daily"] += 1
+                raise QuotaExceeded("AMap daily quota exhausted")
+            if time.monotonic() - start + wait > self.max_wait_seconds:
+                self._stats["rejected_wait"] += 1
+                raise QuotaExceeded(f"AMap quota busy, retry in {wait:.1f}s")
+            throttled = True
+            await asyncio.sleep(wait)
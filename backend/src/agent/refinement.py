@@ -0,0 +1,146 @@
+import json
+from typing import Any, Dict, Iterable, List, Tuple
+
+from pydantic import BaseModel, create_model
+
+from agent.tools_and_schemas import TravelPlan
+
+# 旅行计划中可以被单独改写的部分
+PLAN_SECTIONS: Tuple[str, ...] = tuple(TravelPlan.model_fields)
+
+# food / hotel 直接取自 maps_around_search 的结果，不由模型生成
+POI_KEYWORDS: Dict[str, Tuple[str, ...]] = {
+    "food": ("美食", "餐厅", "餐馆", "餐饮", "小吃"),
+    "hotel": ("酒店", "住宿", "宾馆", "民宿", "旅馆", "客栈"),
+}
+# 关键词认不出来时，按返回 POI 的 AMap 大类判断
+POI_TYPES: Dict[str, str] = {"food": "餐饮服务", "hotel": "住宿服务"}
+
+# 每个部分依赖的 AMap 工具
+SECTION_TOOLS: Dict[str, Tuple[str, ...]] = {
+    "best_time": ("maps_weather", "climate_norms"),
+    "weather": ("maps_weather",),
+    "view_points": ("maps_text_search", "maps_geo"),
+    "food": ("maps_around_search",),
+    "hotel": ("maps_around_search",),
+    "transportation": ("maps_geo", "maps_distance"),
+    "suggested_budget": (),
+    "tips": (),
+    "overall_plan": (),
+}
+
+
+def normalize_sections(sections: Iterable[str]) -> List[str]:
+    """Keep only known plan sections, de-duplicated and in plan order."""
+    wanted = {section.strip() for section in sections or []}
+    return [section for section in PLAN_SECTIONS if section in wanted]
+
+
+def tools_for_sections(sections: Iterable[str]) -> List[str]:
+    """Return the tool names needed to refresh the data behind the given sections."""
+    names: List[str] = []
+    for section in sections:
+        for name in SECTION_TOOLS.get(section, ()):
+            if name not in names:
+                names.append(name)
+    return names
+
+
+def tool_succeeded(entry: Dict[str, Any]) -> bool:
+    """Whether a logged tool call returned data (quota rejections and tool errors do not)."""
+    return entry.get("status", "success") != "error"
+
+
+def entry_sections(entry: Dict[str, Any]) -> List[str]:
+    """Return the plan sections a logged tool call provides data for."""
+    tool_name = entry.get("tool_name")
+    if tool_name == "maps_around_search":
+        keywords = str((entry.get("tool_input") or {}).get("keywords", ""))
+        sections = [
+            section
+            for section, aliases in POI_KEYWORDS.items()
+            if any(alias in keywords for alias in aliases)
+        ]
+        return sections or _poi_type_sections(entry.get("tool_output"))
+    return [
+        section
+        for section, names in SECTION_TOOLS.items()
+        if section not in POI_KEYWORDS and tool_name in names
+    ]
+
+
+def _poi_type_sections(tool_output: Any) -> List[str]:
+    """Return the section most of the returned POIs belong to, judged by their AMap type."""
+    try:
+        pois = json.loads(tool_output).get("pois") or []
+    except (TypeError, ValueError, AttributeError):
+        return []
+    types = [str(poi.get("type", "")) for poi in pois if isinstance(poi, dict)]
+    for section, prefix in POI_TYPES.items():
+        if types and sum(t.startswith(prefix) for t in types) * 2 > len(types):
+            return [section]
+    return []
+
+
+def split_cached_results(
+    mcp_result: List[Dict[str, Any]], refresh_sections: Iterable[str]
+) -> Tuple[List[Dict[str, Any]], List[Dict[str, Any]]]:
+    """Split previous tool results into (reusable, stale) for a refinement.
+
+    Failed calls are never reused: they are stale when their sections are
+    refreshed and dropped otherwise.
+    """
+    refresh = set(refresh_sections)
+    reused, stale = [], []
+    for entry in mcp_result or []:
+        if refresh.intersection(entry_sections(entry)):
+            stale.append(entry)
+        elif tool_succeeded(entry):
+            reused.append(entry)
+    return reused, stale
+
+
+def collect_poi_outputs(mcp_result: List[Dict[str, Any]]) -> Tuple[List[str], List[str]]:
+    """Collect the raw food and hotel search results from the tool log."""
+    food, hotel = [], []
+    for mcp_item in mcp_result or []:
+        if mcp_item["tool_name"] != "maps_around_search" or not tool_succeeded(mcp_item):
+            continue
+        sections = entry_sections(mcp_item)
+        if "food" in sections:
+            food.append(mcp_item["tool_output"])
+        elif "hotel" in sections:
+            hotel.append(mcp_item["tool_output"])
+    return food, hotel
+
+
+def partial_plan_model(sections: Iterable[str]) -> type[BaseModel]:
+    """Build a TravelPlan variant that only contains the given sections."""
+    fields = {
+        name: (TravelPlan.model_fields[name].annotation, TravelPlan.model_fields[name])
+        for name in sections
+    }
+    return create_model("PartialTravelPlan", **fields)
+
+
+def current_plan(state: Dict[str, Any]) -> Dict[str, Any]:
+    """Return the plan sections stored in the graph state."""
+    return {section: state.get(section, "") for section in PLAN_SECTIONS}
+
+
+def build_refinement_report(
+    regenerated: List[str], tool_calls_run: int, tool_calls_reused: int
+) -> Dict[str, Any]:
+    """Summarize how much work an incremental re-plan skipped."""
+    reused = [section for section in PLAN_SECTIONS if section not in regenerated]
+    total_calls = tool_calls_run + tool_calls_reused
+    return {
+        "regenerated_sections": regenerated,
+        "reused_sections": reused,
+        "tool_calls_run": tool_calls_run,
+        "tool_calls_reused": tool_calls_reused,
+        "sections_skipped_ratio": round(len(reused) / len(PLAN_SECTIONS), 2),
+        "tool_calls_skipped_ratio": (
+            round(tool_calls_reused / total_calls, 2) if total_calls else 1.0
+        ),
+    }
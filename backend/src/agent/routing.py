@@ -0,0 +1,109 @@
+import os
+from functools import lru_cache
+from typing import Any, Dict, List, Optional, Sequence
+
+from langchain_core.language_models import BaseChatModel
+from langchain_core.messages import AIMessage, BaseMessage
+from langchain_core.tools import BaseTool
+from langchain_google_genai import ChatGoogleGenerativeAI
+from langchain_openai import ChatOpenAI
+
+# 近似的官方价格，美元 / 百万 token: (输入, 输出)
+MODEL_PRICES: Dict[str, tuple[float, float]] = {
+    "gemini-2.0-flash": (0.10, 0.40),
+    "gemini-2.0-flash-lite": (0.075, 0.30),
+    "gemini-2.5-flash-lite": (0.10, 0.40),
+    "gemini-2.5-flash": (0.30, 2.50),
+    "gemini-2.5-pro": (1.25, 10.00),
+}
+# 命中上下文缓存的输入 token 按原价的 1/4 计费
+CACHED_INPUT_DISCOUNT = 0.25
+
+
+@lru_cache(maxsize=None)
+def get_chat_model(model: str) -> BaseChatModel:
+    """Return the shared chat model instance for ``model``.
+
+    Models prefixed with ``openai:`` (e.g. ``openai:gpt-4o-mini``) use the
+    OpenAI provider, everything else is a Gemini model.
+    """
+    if model.startswith("openai:"):
+        return ChatOpenAI(
+            model=model.removeprefix("openai:"),
+            temperature=1.0,
+            max_retries=2,
+        )
+    return ChatGoogleGenerativeAI(
+        model=model,
+        temperature=1.0,
+        max_retries=2,
+        api_key=os.getenv("GEMINI_API_KEY"),
+    )
+
+
+def _required_args(tool: BaseTool) -> List[str]:
+    schema = tool.tool_call_schema
+    if not isinstance(schema, dict):
+        schema = schema.model_json_schema()
+    return list(schema.get("required", []))
+
+
+def tool_call_errors(response: AIMessage, tools: Sequence[BaseTool]) -> List[str]:
+    """Return the reasons why the tool calls in ``response`` cannot be executed."""
+    errors = [
+        f"invalid tool call {call.get('name')}: {call.get('error')}"
+        for call in getattr(response, "invalid_tool_calls", None) or []
+    ]
+    by_name = {tool.name: tool for tool in tools}
+    for call in response.tool_calls:
+        tool = by_name.get(call["name"])
+        if tool is None:
+            errors.append(f"unknown tool {call['name']}")
+            continue
+        missing = [arg for arg in _required_args(tool) if arg not in call["args"]]
+        if missing:
+            errors.append(f"{call['name']} missing {', '.join(missing)}")
+    return errors
+
+
+def stall_reason(messages: Sequence[BaseMessage], response: AIMessage, phase: str) -> Optional[str]:
+    """Detect a cheap-model turn that makes no progress on the plan."""
+    if not response.tool_calls:
+        if phase != "finalize":
+            return f"stopped calling tools during {phase}"
+        if not response.content:
+            return "empty answer"
+        return None
+    previous = next((m for m in reversed(messages) if isinstance(m, AIMessage)), None)
+    if previous is not None and previous.tool_calls:
+        signature = [(c["name"], c["args"]) for c in response.tool_calls]
+        if signature == [(c["name"], c["args"]) for c in previous.tool_calls]:
+            return "repeated previous tool calls"
+    return None
+
+
+def step_cost(model: str, usage: Dict[str, Any]) -> float:
+    """Estimate the USD cost of one model call from its token usage."""
+    input_price, output_price = MODEL_PRICES.get(model, (0.0, 0.0))
+    cost = (
+        usage.get("uncached_input_tokens", 0) * input_price
+        + usage.get("cached_input_tokens", 0) * input_price * CACHED_INPUT_DISCOUNT
+        + usage.get("output_tokens", 0) * output_price
+    ) / 1_000_000
+    return round(cost, 6)
+
+
+def routing_step(
+    node: str, tier: str, model: str, usage: Dict[str, Any], reason: str = ""
+) -> Dict[str, Any]:
+    """Build the record of which tier a step used and what it cost."""
+    return {
+        "node": node,
+        "tier": tier,
+        "model": model,
+        "reason": reason,
+        "input_tokens": usage.get("input_tokens", 0),
+        "cached_input_tokens": usage.get("cached_input_tokens", 0),
+        "output_tokens": usage.get("output_tokens", 0),
+        "cost_usd": step_cost(model, usage),
+    }
@@ -0,0 +1,41 @@
+import os
+
+from dotenv import load_dotenv
+from google.genai import Client
+
+from agent.cancellation import CancellationRegistry
+from agent.hedging import HedgedInvoker
+from agent.poi_store import load_local_backend
+from agent.prewarm import PrewarmCache
+from agent.prompt_cache import PromptCache
+from agent.quota import QuotaGovernor
+from agent.structured_output import StructuredOutputRepair
+from agent.tool_selection import remaining_llm_calls
+
+# 图和 HTTP 应用共享的进程内单例。
+# langgraph-api 按文件路径加载 app.py 时会生成新的模块名，这些对象必须放在两边都按包名
+# 导入的模块里，否则 API 端点看到的是另一份实例（取消、预热、指标都会失效）。
+
+load_dotenv()
+
+if os.getenv("GEMINI_API_KEY") is None:
+    raise ValueError("GEMINI_API_KEY is not set")
+
+# Used for Google Search API
+genai_client = Client(api_key=os.getenv("GEMINI_API_KEY"))
+# 离线 POI 快照（可选）：稳定的 POI / 地理编码查询先查本地，未命中再调用 AMap
+poi_backend = load_local_backend(os.getenv("POI_STORE_PATH"))
+# 静态系统提示词 + 工具 schema 作为可缓存前缀，state 中只保存动态的用户输入
+prompt_cache = PromptCache(genai_client)
+# 慢请求的对冲：超过延迟分位数时发出备用请求，先返回的有效结果获胜
+hedger = HedgedInvoker()
+# 所有副本共享 AMap key 的限额（Redis 令牌桶，Redis 不可用时退回本地限额）
+amap_quota = QuotaGovernor.from_env()
+# 结构化输出格式有误时先在本地修复，只为缺失的字段重新请求
+structured_repair = StructuredOutputRepair()
+# 热门目的地的工具结果缓存和规划骨架，由 app.py 里的预热任务在低峰期填充；需求记录在 Redis 里
+prewarm_cache = PrewarmCache.from_env()
+# 统计取消（run-cancel API 或客户端断开）中止的节点和省下的 LLM 调用
+cancellations = CancellationRegistry(
+    remaining_llm_calls=lambda state: remaining_llm_calls(state.get("mcp_result"))
+)
@@ -10,6 +10,27 @@ from agent.tools_and_schemas import TravelPlan
 
 import operator
 
+NEW_PLAN = "__new_plan__"
+
+
+def merge_token_usage(left: dict | None, right: dict | None) -> dict:
+    """Sum token counters; an update carrying NEW_PLAN starts a new turn's total."""
+    if not right:
+        return dict(left or {})
+    merged = {} if right.get(NEW_PLAN) else dict(left or {})
+    for key, value in right.items():
+        if key != NEW_PLAN:
+            merged[key] = merged.get(key, 0) + value
+    return merged
+
+
+def extend_steps(left: list | None, right: list | None) -> list:
+    """Append records; an update starting with NEW_PLAN starts over."""
+    if right and right[0] == NEW_PLAN:
+        return list(right[1:])
+    return (left or []) + (right or [])
+
+
 class AgentState(TypedDict):
     messages: Annotated[list, lambda x, y: x + y]
 
@@ -21,6 +42,8 @@ class OverallState(TypedDict):
     messages: Annotated[list, add_messages]
     mcp_result: list[str]
     current_destination: str  # 添加当前目的地字段
+    location: str
+    date: str
     best_time: str
     suggested_budget: str
     view_points: str
@@ -30,6 +53,12 @@ class OverallState(TypedDict):
     tips: str
     weather: str
     overall_plan: str
+    refinement_scope: dict  # 追问时需要改写/重新查询的计划部分
+    refinement_report: dict  # 增量规划跳过了多少工作
+    token_usage: Annotated[dict, merge_token_usage]  # 每次规划的缓存/非缓存输入 token
+    model_steps: Annotated[list, extend_steps]  # 每一步使用的模型档位和成本
+    web_research_result: Annotated[list, extend_steps]  # 联网搜索分支带引用的结果
+    sources_gathered: Annotated[list, extend_steps]  # 引用的网页来源
 
 class TravelPlanState(TypedDict):
     messages: Annotated[list, add_messages]
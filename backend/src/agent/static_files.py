@@ -0,0 +1,263 @@
+import gzip
+import hashlib
+import mimetypes
+import pathlib
+import re
+from collections import Counter, OrderedDict
+from dataclasses import dataclass, field
+from typing import Any, Dict, List, Optional, Tuple
+
+from starlette.responses import PlainTextResponse
+
+try:
+    import brotli
+except ImportError:  # brotli 是可选依赖，没有时只提供 gzip
+    brotli = None
+
+# 值得压缩的类型；图片、字体等本身已经压缩过
+_COMPRESSIBLE_TYPES = (
+    "text/",
+    "application/javascript",
+    "application/json",
+    "application/manifest+json",
+    "application/wasm",
+    "application/xml",
+    "image/svg+xml",
+)
+# Vite 产物放在 assets/ 下，文件名带 8 位内容哈希，例如 assets/index-DyT4bX9a.js，可以永久缓存；
+# public/ 里原样复制的文件（apple-touch-icon.png 等）没有哈希，必须重新验证
+_HASHED_ASSET = re.compile(r"^assets/(?:.+/)?[^/]+-(?P<hash>[0-9A-Za-z_-]{8})\.[0-9A-Za-z]+$")
+_LOWERCASE_WORD = re.compile(r"[a-z_-]+")
+_IMMUTABLE = "public, max-age=31536000, immutable"
+_REVALIDATE = "no-cache"
+# 压缩后至少要小这么多才值得单独保存
+_MIN_SAVING = 0.9
+_MIN_COMPRESS_BYTES = 1024
+
+
+@dataclass
+class _Variant:
+    encoding: str
+    etag: str
+    size: int
+    path: Optional[pathlib.Path] = None
+
+
+@dataclass
+class _Asset:
+    media_type: str
+    cache_control: str
+    variants: Dict[str, _Variant] = field(default_factory=dict)
+
+
+def _is_hashed_asset(relative: str) -> bool:
+    match = _HASHED_ASSET.match(relative)
+    if match is None:
+        return False
+    # 只由小写字母组成的段更可能是普通单词（例如 -building.png），不当作哈希
+    return _LOWERCASE_WORD.fullmatch(match.group("hash")) is None
+
+
+def _compress(body: bytes, encoding: str) -> bytes:
+    if encoding == "br":
+        return brotli.compress(body, quality=11)
+    return gzip.compress(body, compresslevel=9, mtime=0)
+
+
+def _accepted_encodings(header: str) -> Dict[str, float]:
+    """Parse ``Accept-Encoding`` into ``{coding: q}``."""
+    accepted: Dict[str, float] = {}
+    for item in header.split(","):
+        coding, _, params = item.strip().partition(";")
+        if not coding:
+            continue
+        q = 1.0
+        for param in params.split(";"):
+            name, _, value = param.strip().partition("=")
+            if name == "q":
+                try:
+                    q = float(value)
+                except ValueError:
+                    q = 0.0
+        accepted[coding.strip().lower()] = q
+    return accepted
+
+
+def _etag_matches(if_none_match: str, etag: str) -> bool:
+    if if_none_match.strip() == "*":
+        return True
+    # If-None-Match 使用弱比较
+    return any(tag.strip().removeprefix("W/") == etag for tag in if_none_match.split(","))
+
+
+class PrecompressedStaticFiles:
+    """Serve a frontend build with precompressed variants and validator caching.
+
+    Every file is hashed and compressed (gzip, plus brotli when installed)
+    once at startup; ``.gz``/``.br`` files produced at build time are used
+    as is. Requests get the best encoding allowed by ``Accept-Encoding``,
+    a strong per-encoding ETag and ``immutable`` caching for hashed asset
+    names. Conditional requests are answered from the in-memory index
+    without touching disk, and up to ``cache_bytes`` of response bodies are
+    kept in an LRU cache.
+    """
+
+    def __init__(self, directory: pathlib.Path, html: bool = True, cache_bytes: int = 32 * 1024 * 1024):
+        self.directory = pathlib.Path(directory)
+        self.html = html
+        self.cache_bytes = cache_bytes
+        self._cache: "OrderedDict[Tuple[str, str], bytes]" = OrderedDict()
+        self._cached_bytes = 0
+        self._stats: Counter = Counter()
+        self._assets: Dict[str, _Asset] = {}
+        self._build_index()
+
+    def metrics(self) -> Dict[str, Any]:
+        return {
+            **self._stats,
+            "files": len(self._assets),
+            "cached_bytes": self._cached_bytes,
+            "encodings": sorted({e for a in self._assets.values() for e in a.variants}),
+        }
+
+    def _build_index(self) -> None:
+        for path in sorted(self.directory.rglob("*")):
+            if not path.is_file() or path.suffix in (".gz", ".br"):
+                continue
+            relative = path.relative_to(self.directory).as_posix()
+            media_type = mimetypes.guess_type(path.name)[0] or "application/octet-stream"
+            if media_type.startswith("text/") or media_type == "application/javascript":
+                media_type += "; charset=utf-8"
+            cache_control = _IMMUTABLE if _is_hashed_asset(relative) else _REVALIDATE
+            asset = _Asset(media_type=media_type, cache_control=cache_control)
+
+            body = path.read_bytes()
+            digest = hashlib.sha256(body).hexdigest()[:20]
+            asset.variants["identity"] = _Variant("identity", f'"{digest}"', len(body), path)
+            self._remember(relative, "identity", body)
+            if len(body) >= _MIN_COMPRESS_BYTES and media_type.startswith(_COMPRESSIBLE_TYPES):
+                for encoding, suffix in (("br", ".br"), ("gzip", ".gz")):
+                    variant = self._compressed_variant(path, body, digest, encoding, suffix, relative)
+                    if variant is not None:
+                        asset.variants[encoding] = variant
+            self._assets[relative] = asset
+
+    def _compressed_variant(
+        self, path: pathlib.Path, body: bytes, digest: str, encoding: str, suffix: str, relative: str
+    ) -> Optional[_Variant]:
+        etag = f'"{digest}-{encoding}"'
+        prebuilt = path.with_name(path.name + suffix)
+        if prebuilt.is_file():
+            return _Variant(encoding, etag, prebuilt.stat().st_size, prebuilt)
+        if encoding == "br" and brotli is None:
+            return None
+        compressed = _compress(body, encoding)
+        if len(compressed) > len(body) * _MIN_SAVING:
+            return None
+        self._stats[f"precompressed_{encoding}"] += 1
+        self._remember(relative, encoding, compressed)
+        return _Variant(encoding, etag, len(compressed))
+
+    def _remember(self, relative: str, encoding: str, body: bytes) -> None:
+        if len(body) > self.cache_bytes // 4:
+            return
+        key = (relative, encoding)
+        if key in self._cache:
+            self._cache.move_to_end(key)
+            return
+        self._cache[key] = body
+        self._cached_bytes += len(body)
+        while self._cached_bytes > self.cache_bytes:
+            _, evicted = self._cache.popitem(last=False)
+            self._cached_bytes -= len(evicted)
+
+    def _body(self, relative: str, variant: _Variant) -> bytes:
+        key = (relative, variant.encoding)
+        body = self._cache.get(key)
+        if body is not None:
+            self._cache.move_to_end(key)
+            self._stats["memory_hits"] += 1
+            return body
+        self._stats["disk_reads"] += 1
+        if variant.path is not None:
+            body = variant.path.read_bytes()
+        else:
+            # 启动时压缩的内容被挤出缓存后，从原文件重新压缩
+            body = _compress((self.directory / relative).read_bytes(), variant.encoding)
+        self._remember(relative, variant.encoding, body)
+        return body
+
+    def _resolve(self, path: str) -> Optional[str]:
+        relative = path.lstrip("/")
+        if relative in self._assets:
+            return relative
+        if self.html:
+            index = f"{relative.rstrip('/')}/index.html".lstrip("/")
+            if index in self._assets:
+                return index
+        return None
+
+    @staticmethod
+    def _choose(asset: _Asset, accept_encoding: str) -> _Variant:
+        accepted = _accepted_encodings(accept_encoding)
+        wildcard = accepted.get("*")
+        candidates = []
+        for encoding, variant in asset.variants.items():
+            if encoding == "identity":
+                # 除非明确写了 q=0，identity 总是可以接受
+                q = accepted.get("identity", 1.0 if wildcard is None else max(wildcard, 0.001))
+            else:
+                q = accepted.get(encoding, wildcard or 0.0)
+            if q > 0:
+                candidates.append((q, -variant.size, variant))
+        if not candidates:
+            return asset.variants["identity"]
+        # q 值相同时选最小的编码
+        return max(candidates, key=lambda item: item[:2])[2]
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return
+        if scope["method"] not in ("GET", "HEAD"):
+            await PlainTextResponse("Method Not Allowed", status_code=405)(scope, receive, send)
+            return
+        # 挂载在 /app 下时去掉前缀；只查内存索引，所以不会访问到构建目录以外的文件
+        path, root_path = scope["path"], scope.get("root_path", "")
+        if root_path and path.startswith(root_path):
+            path = path[len(root_path) :]
+        relative = self._resolve(path)
+        if relative is None:
+            self._stats["not_found"] += 1
+            not_found = self._resolve("404.html") if self.html else None
+            if not_found is None:
+                await PlainTextResponse("Not Found", status_code=404)(scope, receive, send)
+                return
+            await self._send(scope, send, not_found, 404)
+            return
+        await self._send(scope, send, relative, 200)
+
+    async def _send(self, scope, send, relative: str, status: int) -> None:
+        asset = self._assets[relative]
+        headers = {k.decode("latin-1"): v.decode("latin-1") for k, v in scope.get("headers") or []}
+        variant = self._choose(asset, headers.get("accept-encoding", ""))
+        response_headers: List[Tuple[bytes, bytes]] = [
+            (b"etag", variant.etag.encode()),
+            (b"cache-control", asset.cache_control.encode()),
+            (b"vary", b"Accept-Encoding"),
+        ]
+        if status == 200 and _etag_matches(headers.get("if-none-match", ""), variant.etag):
+            self._stats["not_modified"] += 1
+            await send({"type": "http.response.start", "status": 304, "headers": response_headers})
+            await send({"type": "http.response.body", "body": b""})
+            return
+
+        self._stats[f"served_{variant.encoding}"] += 1
+        response_headers += [
+            (b"content-type", asset.media_type.encode()),
+            (b"content-length", str(variant.size).encode()),
+        ]
+        if variant.encoding != "identity":
+            response_headers.append((b"content-encoding", variant.encoding.encode()))
+        await send({"type": "http.response.start", "status": status, "headers": response_headers})
+        body = b"" if scope["method"] == "HEAD" else self._body(relative, variant)
+        await send({"type": "http.response.body", "body": body})
@@ -0,0 +1,245 @@
+import json
+import logging
+import re
+import typing
+from collections import Counter
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple, Type
+
+from langchain_core.messages import AIMessage
+from pydantic import BaseModel, ValidationError, create_model
+
+from agent.prompts import structured_output_fill_instructions
+
+logger = logging.getLogger(__name__)
+
+# 把字符串拆成列表时使用的分隔符
+_LIST_SEPARATORS = re.compile(r"[,，、;；\n]+")
+
+
+def raw_output_text(raw: Optional[AIMessage]) -> str:
+    """Return the JSON text the model produced, whichever output method was used."""
+    if raw is None:
+        return ""
+    for call in raw.tool_calls or []:
+        return json.dumps(call["args"], ensure_ascii=False)
+    for call in getattr(raw, "invalid_tool_calls", None) or []:
+        if call.get("args"):
+            return str(call["args"])
+    if isinstance(raw.content, str):
+        return raw.content
+    return "".join(
+        part if isinstance(part, str) else str(part.get("text", ""))
+        for part in raw.content
+    )
+
+
+def close_json(text: str) -> Tuple[Optional[str], List[str]]:
+    """Repair a JSON object without re-asking the model.
+
+    Drops anything around the outermost object (e.g. Markdown fences),
+    removes trailing commas and, when the output was cut off, rolls back to
+    the last complete top-level field and closes the object. A field whose
+    value was truncated, including a nested object or list cut off part-way,
+    is dropped rather than kept half-written, so the caller sees it as
+    missing. Returns the repaired text (or None) and the defects fixed.
+    """
+    start = text.find("{")
+    if start == -1:
+        return None, []
+    defects: List[str] = []
+    out: List[str] = []
+    stack: List[str] = []
+    # 截断时回退到的输出长度：最后一个完整的顶层字段之后
+    safe_length = 0
+    in_string = escaped = False
+    for ch in text[start:]:
+        if in_string:
+            out.append(ch)
+            if escaped:
+                escaped = False
+            elif ch == "\\":
+                escaped = True
+            elif ch == '"':
+                in_string = False
+            continue
+        if ch == '"':
+            in_string = True
+        elif ch in "{[":
+            stack.append("}" if ch == "{" else "]")
+            out.append(ch)
+            if len(stack) == 1:
+                safe_length = len(out)
+            continue
+        elif ch in "}]":
+            while out and out[-1].isspace():
+                out.pop()
+            if out and out[-1] == ",":
+                out.pop()
+                defects.append("trailing_comma")
+            if not stack or stack[-1] != ch:
+                break
+            stack.pop()
+            out.append(ch)
+            if len(stack) == 1:
+                safe_length = len(out)
+            if not stack:
+                return "".join(out), defects
+            continue
+        elif ch == "," and len(stack) == 1:
+            safe_length = len(out)
+        out.append(ch)
+
+    if not stack:
+        return None, defects
+    defects.append("truncated")
+    return "".join(out[:safe_length]) + "}", defects
+
+
+def _coerce(value: Any, annotation: Any) -> Tuple[Any, bool]:
+    """Fix the common type mismatches between the model output and the schema."""
+    origin = typing.get_origin(annotation)
+    if annotation is str:
+        if isinstance(value, list):
+            return "\n".join(str(item) for item in value if item not in (None, "")), True
+        if isinstance(value, dict):
+            return json.dumps(value, ensure_ascii=False), True
+        if isinstance(value, (int, float, bool)):
+            return str(value), True
+    elif annotation is bool and isinstance(value, str):
+        lowered = value.strip().lower()
+        if lowered in ("true", "yes", "1", "是"):
+            return True, True
+        if lowered in ("false", "no", "0", "否"):
+            return False, True
+    elif origin in (list, List) and isinstance(value, str):
+        return [item.strip() for item in _LIST_SEPARATORS.split(value) if item.strip()], True
+    return value, False
+
+
+class StructuredOutputRepair:
+    """Salvage malformed structured output instead of regenerating all of it.
+
+    Defects such as truncation, trailing commas and list-vs-string
+    mismatches are fixed locally. Fields that are still missing are filled
+    from caller-supplied defaults when they are optional for that node, and
+    otherwise re-requested with a small prompt that asks for only those
+    fields.
+    """
+
+    def __init__(self):
+        self._stats: Counter = Counter()
+
+    def metrics(self) -> Dict[str, Any]:
+        return dict(self._stats)
+
+    def salvage(
+        self,
+        schema: Type[BaseModel],
+        raw: Optional[AIMessage],
+        optional: Optional[Dict[str, Any]] = None,
+    ) -> Tuple[Dict[str, Any], List[str], List[str]]:
+        """Parse what the model produced; return (valid fields, missing fields, defects)."""
+        text, defects = close_json(raw_output_text(raw))
+        data: Dict[str, Any] = {}
+        if text is not None:
+            try:
+                loaded = json.loads(text, strict=False)
+            except ValueError:
+                loaded = None
+            if isinstance(loaded, dict):
+                data = loaded
+
+        values: Dict[str, Any] = {}
+        for name, field in schema.model_fields.items():
+            # 空对象 / 空列表和没给出一样，交给默认值或重新请求
+            if data.get(name) is None or data[name] in ({}, []):
+                continue
+            values[name], coerced = _coerce(data[name], field.annotation)
+            if coerced:
+                defects.append(f"coerced:{name}")
+        # 单独校验每个字段，类型无法修复的字段当作缺失
+        for name in list(values):
+            field = schema.model_fields[name]
+            probe = create_model("Probe", value=(field.annotation, ...))
+            try:
+                values[name] = probe(value=values[name]).value
+            except ValidationError:
+                values.pop(name)
+
+        missing = []
+        for name, field in schema.model_fields.items():
+            if name in values:
+                continue
+            if optional and name in optional:
+                values[name] = optional[name]
+                defects.append(f"default:{name}")
+            elif not field.is_required():
+                values[name] = field.get_default(call_default_factory=True)
+                defects.append(f"default:{name}")
+            else:
+                missing.append(name)
+        return values, missing, defects
+
+    def is_salvageable(self, schema: Type[BaseModel], result: Dict[str, Any]) -> bool:
+        """Whether a structured-output result can be used without a full retry."""
+        if result.get("parsed") is not None:
+            return True
+        _, missing, _ = self.salvage(schema, result.get("raw"))
+        return len(missing) < len(schema.model_fields)
+
+    async def arepair(
+        self,
+        node: str,
+        schema: Type[BaseModel],
+        result: Dict[str, Any],
+        source: str,
+        request_fields: Callable[[Type[BaseModel], str], Awaitable[Dict[str, Any]]],
+        optional: Optional[Dict[str, Any]] = None,
+    ) -> Tuple[BaseModel, List[AIMessage]]:
+        """Return the repaired object and the raw messages of any extra requests.
+
+        ``request_fields(schema, prompt)`` runs a structured-output call with
+        ``include_raw=True`` for the sub-schema of missing fields.
+        """
+        if result.get("parsed") is not None:
+            self._stats["parsed"] += 1
+            return result["parsed"], []
+
+        values, missing, defects = self.salvage(schema, result.get("raw"), optional)
+        for defect in defects:
+            self._stats[f"defect:{defect.split(':')[0]}"] += 1
+        extra: List[AIMessage] = []
+        if missing:
+            # 只重新生成缺失的字段，而不是整份输出
+            fill_schema = create_model(
+                f"{schema.__name__}Missing",
+                **{name: (schema.model_fields[name].annotation, schema.model_fields[name]) for name in missing},
+            )
+            prompt = structured_output_fill_instructions.format(
+                fields=", ".join(missing),
+                partial=json.dumps(values, ensure_ascii=False),
+                source=source,
+            )
+            filled = await request_fields(fill_schema, prompt)
+            if filled.get("raw") is not None:
+                extra.append(filled["raw"])
+            if filled.get("parsed") is not None:
+                values.update(filled["parsed"].model_dump())
+            else:
+                fill_values, still_missing, _ = self.salvage(fill_schema, filled.get("raw"))
+                values.update(fill_values)
+                if still_missing:
+                    self._stats["failed"] += 1
+                    logger.warning("%s: could not repair %s, missing %s", node, schema.__name__, still_missing)
+                    raise result.get("parsing_error") or ValueError(
+                        f"{schema.__name__} is missing {', '.join(still_missing)}"
+                    )
+            self._stats["regenerated"] += 1
+            self._stats["fields_regenerated"] += len(missing)
+        else:
+            self._stats["repaired"] += 1
+        logger.info(
+            "%s: repaired %s (%s; regenerated %s)",
+            node, schema.__name__, ", ".join(defects) or "no defects", missing or "nothing",
+        )
+        return schema.model_validate(values), extra
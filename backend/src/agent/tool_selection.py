@@ -0,0 +1,97 @@
+from itertools import groupby
+from typing import Any, Dict, Iterable, List, Optional, Sequence, Tuple
+
+from langchain_core.language_models import BaseChatModel
+from langchain_core.runnables import Runnable
+from langchain_core.tools import BaseTool
+
+from agent.refinement import collect_poi_outputs, tool_succeeded
+
+# 每个规划阶段只绑定需要的工具，其余工具的 schema 不随请求发送
+PHASE_TOOLS: Dict[str, Tuple[str, ...]] = {
+    "gather": ("maps_weather", "maps_text_search", "climate_norms"),
+    "locate": ("maps_geo", "maps_text_search"),
+    "enrich": ("maps_around_search", "maps_geo"),
+    "finalize": (),
+}
+# 一个阶段连续这么多轮都没有完成时跳到下一阶段，避免模型反复搜索却始终进不了 finalize
+MAX_PHASE_TURNS = 3
+
+
+def _completed_phase(mcp_result: List[Dict[str, Any]]) -> int:
+    """Index of the first phase whose tool results are still missing."""
+    # 被限额拒绝或出错的调用不算完成，这一阶段还要再试
+    called = {entry["tool_name"] for entry in mcp_result if tool_succeeded(entry)}
+    if "maps_weather" not in called:
+        return 0
+    if "maps_geo" not in called:
+        return 1
+    food, hotel = collect_poi_outputs(mcp_result)
+    if not (food and hotel):
+        return 2
+    return 3
+
+
+def planning_phase(mcp_result: Optional[List[Dict[str, Any]]]) -> str:
+    """Infer the planning phase from the tool calls made so far.
+
+    Tool calls are replayed turn by turn (one ``conversation_id`` per agent
+    turn); a phase that is still incomplete after ``MAX_PHASE_TURNS`` turns
+    is skipped.
+    """
+    phases = list(PHASE_TOOLS)
+    seen: List[Dict[str, Any]] = []
+    floor = turns = 0
+    for _, turn in groupby(mcp_result or [], key=lambda entry: entry.get("conversation_id")):
+        current = max(_completed_phase(seen), floor)
+        seen.extend(turn)
+        if _completed_phase(seen) > current:
+            turns = 0
+            continue
+        turns += 1
+        if turns >= MAX_PHASE_TURNS:
+            floor, turns = current + 1, 0
+    return phases[min(max(_completed_phase(seen), floor), len(phases) - 1)]
+
+
+class ToolSelector:
+    """Select the minimal tool subset per phase and cache the bound models."""
+
+    def __init__(self, tools: Sequence[BaseTool]):
+        self.tools = {tool.name: tool for tool in tools}
+        self._bound: Dict[Tuple[int, Tuple[str, ...]], Runnable] = {}
+
+    def select(
+        self, names: Iterable[str], allowlist: Optional[Iterable[str]] = None
+    ) -> List[BaseTool]:
+        """Return the available tools among ``names`` that pass the allowlist."""
+        allowed = set(allowlist) if allowlist else None
+        return [
+            self.tools[name]
+            for name in names
+            if name in self.tools and (allowed is None or name in allowed)
+        ]
+
+    def for_phase(
+        self, phase: str, allowlist: Optional[Iterable[str]] = None
+    ) -> List[BaseTool]:
+        """Return the tools to bind for a planning phase."""
+        return self.select(PHASE_TOOLS[phase], allowlist)
+
+    def bind(self, llm: BaseChatModel, tools: Sequence[BaseTool]) -> Runnable:
+        """Return ``llm`` bound to ``tools``, reusing a previously bound model."""
+        key = (id(llm), tuple(sorted(tool.name for tool in tools)))
+        if key not in self._bound:
+            self._bound[key] = llm.bind_tools(list(tools)) if tools else llm
+        return self._bound[key]
+
+    def prebuild(self, llm: BaseChatModel, allowlist: Optional[Iterable[str]] = None) -> None:
+        """Bind every phase subset up front so agent turns never pay for it."""
+        for phase in PHASE_TOOLS:
+            self.bind(llm, self.for_phase(phase, allowlist))
+
+
+def remaining_llm_calls(mcp_result: Optional[List[Dict[str, Any]]]) -> int:
+    """Lower bound of LLM calls left in a plan: one agent turn per remaining phase plus the final answer."""
+    phases = list(PHASE_TOOLS)
+    return len(phases) - phases.index(planning_phase(mcp_result)) + 1
@@ -64,4 +64,18 @@ class TravelPlan(BaseModel):
     )
     overall_plan: str = Field(
         description="The overall plan for the travel."
-    )
\ No newline at end of file
+    )
+
+class RefinementScope(BaseModel):
+    is_refinement: bool = Field(
+        description="Whether the follow-up edits the existing plan for the same location, rather than asking for a new trip."
+    )
+    affected_sections: List[str] = Field(
+        description="The travel plan sections that must be rewritten to satisfy the follow-up."
+    )
+    refresh_sections: List[str] = Field(
+        description="The sections whose map/weather data must be fetched again instead of reusing the previous results."
+    )
+    date: str = Field(
+        description="The new travel date if the follow-up changes it, otherwise an empty string."
+    )
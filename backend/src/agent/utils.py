@@ -36,43 +36,64 @@ def resolve_urls(urls_to_resolve: List[Any], id: int) -> Dict[str, str]:
     return resolved_map
 
 
-def insert_citation_markers(text, citations_list):
+def insert_citation_markers(text, citations_list, byte_offsets=False):
     """
     Inserts citation markers into a text string based on start and end indices.
 
+    The text is rebuilt in a single pass over the citations sorted by
+    position, so the cost is O(n + k log k) instead of re-slicing the whole
+    string for every citation.
+
     Args:
         text (str): The original text string.
         citations_list (list): A list of dictionaries, where each dictionary
                                contains 'start_index', 'end_index', and
-                               'segment_string' (the marker to insert).
+                               'segments' (the links to insert).
                                Indices are assumed to be for the original text.
+        byte_offsets (bool): Whether the indices are UTF-8 byte offsets, as
+                             returned in Gemini grounding metadata, rather
+                             than character offsets.
 
     Returns:
         str: The text with citation markers inserted.
     """
-    # Sort citations by end_index in descending order.
-    # If end_index is the same, secondary sort by start_index descending.
-    # This ensures that insertions at the end of the string don't affect
-    # the indices of earlier parts of the string that still need to be processed.
-    sorted_citations = sorted(
-        citations_list, key=lambda c: (c["end_index"], c["start_index"]), reverse=True
+    # Markers that share an end index keep the order of the previous
+    # implementation: ascending start index, and for identical ranges the
+    # later citation first.
+    ordered = sorted(
+        enumerate(citations_list),
+        key=lambda item: (item[1]["end_index"], item[1]["start_index"], -item[0]),
     )
-
-    modified_text = text
-    for citation_info in sorted_citations:
-        # These indices refer to positions in the *original* text,
-        # but since we iterate from the end, they remain valid for insertion
-        # relative to the parts of the string already processed.
-        end_idx = citation_info["end_index"]
-        marker_to_insert = ""
+    ends = [citation["end_index"] for _, citation in ordered]
+    if byte_offsets:
+        ends = _byte_to_char_offsets(text, ends)
+
+    pieces = []
+    previous = 0
+    for end_idx, (_, citation_info) in zip(ends, ordered):
+        end_idx = min(max(end_idx, previous), len(text))
+        pieces.append(text[previous:end_idx])
         for segment in citation_info["segments"]:
-            marker_to_insert += f" [{segment['label']}]({segment['short_url']})"
-        # Insert the citation marker at the original end_idx position
-        modified_text = (
-            modified_text[:end_idx] + marker_to_insert + modified_text[end_idx:]
-        )
+            pieces.append(f" [{segment['label']}]({segment['short_url']})")
+        previous = end_idx
+    pieces.append(text[previous:])
+    return "".join(pieces)
 
-    return modified_text
+
+def _byte_to_char_offsets(text, sorted_byte_offsets):
+    """
+    Convert ascending UTF-8 byte offsets of ``text`` into character offsets in one pass.
+    """
+    if text.isascii():
+        return list(sorted_byte_offsets)
+    char_offsets = []
+    char_idx = byte_idx = 0
+    for target in sorted_byte_offsets:
+        while char_idx < len(text) and byte_idx < target:
+            byte_idx += len(text[char_idx].encode("utf-8"))
+            char_idx += 1
+        char_offsets.append(char_idx)
+    return char_offsets
 
 
 def get_citations(response, resolved_urls_map):
@@ -0,0 +1,5 @@
+import os
+
+# agent.configuration refuses to import without these; unit tests never call the real APIs
+os.environ.setdefault("AMAP_API_KEY", "test-amap-key")
+os.environ.setdefault("GEMINI_API_KEY", "test-gemini-key")
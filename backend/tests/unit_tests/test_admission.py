@@ -0,0 +1,82 @@
+import asyncio
+import json
+
+from agent import admission as admission_module
+from agent.admission import AdmissionController, AdmissionMiddleware
+
+
+class FakeLangGraphApi:
+    """Minimal ASGI app with the run routes the middleware gates."""
+
+    def __init__(self):
+        self.run_finished = asyncio.Event()
+        self.joined = []
+
+    async def __call__(self, scope, receive, send):
+        path = scope["path"]
+        if scope["method"] == "GET" and path.endswith("/join"):
+            self.joined.append(path)
+            await self.run_finished.wait()
+            body = b"{}"
+        elif path.endswith("/runs/wait"):
+            await self.run_finished.wait()
+            body = b"{}"
+        else:
+            body = json.dumps({"run_id": "run-1", "thread_id": "thread-1"}).encode()
+        await send({"type": "http.response.start", "status": 200, "headers": []})
+        await send({"type": "http.response.body", "body": body})
+
+
+async def post(app, path, headers=()):
+    messages = []
+
+    async def receive():
+        return {"type": "http.request", "body": b"{}", "more_body": False}
+
+    async def send(message):
+        messages.append(message)
+
+    scope = {"type": "http", "method": "POST", "path": path, "headers": list(headers)}
+    await app(scope, receive, send)
+    return messages[0]["status"], messages[-1]["body"]
+
+
+def test_background_run_holds_slot_until_it_finishes():
+    async def scenario():
+        api = FakeLangGraphApi()
+        controller = AdmissionController(max_concurrent=1, max_queue=0)
+        app = AdmissionMiddleware(api, controller)
+
+        status, body = await post(app, "/threads/thread-1/runs")
+        assert status == 200 and json.loads(body)["run_id"] == "run-1"
+        await asyncio.sleep(0)
+        # 创建请求已经返回，但 run 还在执行，名额不能释放
+        assert controller.metrics()["active"] == 1
+        assert len(admission_module._background_tasks) == 1
+        assert api.joined == ["/threads/thread-1/runs/run-1/join"]
+
+        status, body = await post(app, "/runs")
+        assert status == 503 and b"overloaded" in body
+
+        api.run_finished.set()
+        await asyncio.sleep(0.01)
+        assert controller.metrics()["active"] == 0
+        assert controller.metrics()["completed"] == 1
+        assert not admission_module._background_tasks
+
+    asyncio.run(scenario())
+
+
+def test_blocking_run_and_other_routes():
+    async def scenario():
+        api = FakeLangGraphApi()
+        api.run_finished.set()
+        controller = AdmissionController(max_concurrent=1)
+        app = AdmissionMiddleware(api, controller)
+
+        assert (await post(app, "/threads/thread-1/runs/wait"))[0] == 200
+        assert (await post(app, "/threads/search"))[0] == 200
+        assert controller.metrics()["admitted"] == 1
+        assert controller.metrics()["active"] == 0
+
+    asyncio.run(scenario())
@@ -0,0 +1,121 @@
+import asyncio
+import importlib
+from typing import Annotated, TypedDict
+
+import pytest
+from langchain_core.messages import AIMessage, ToolMessage
+from langgraph.checkpoint.memory import InMemorySaver
+from langgraph.graph import END, START, StateGraph, add_messages
+
+from agent.cancellation import CancellationRegistry
+from agent.quota import QuotaGovernor, QuotaLimits
+
+graph_module = importlib.import_module("agent.graph")
+
+
+class FakeToolNode:
+    """Stand-in for the AMap ToolNode; each tool takes ``delays[name]`` seconds."""
+
+    def __init__(self, delays):
+        self.delays = delays
+        self.calls = []
+
+    async def ainvoke(self, state):
+        (tool_call,) = state["messages"][-1].tool_calls
+        self.calls.append(tool_call["name"])
+        await asyncio.sleep(self.delays[tool_call["name"]])
+        return {"messages": [ToolMessage(content=f"{tool_call['name']} ok", name=tool_call["name"], tool_call_id=tool_call["id"])]}
+
+
+class ToolState(TypedDict):
+    messages: Annotated[list, add_messages]
+    mcp_result: list
+
+
+@pytest.fixture
+def tool_graph(monkeypatch):
+    cancellations = CancellationRegistry()
+    tool_node = FakeToolNode({"maps_weather": 0.0, "maps_text_search": 1.0})
+    monkeypatch.setattr(graph_module, "tool_node", tool_node)
+    monkeypatch.setattr(graph_module, "poi_backend", None)
+    monkeypatch.setattr(graph_module, "amap_quota", QuotaGovernor(QuotaLimits(global_qps=100, session_qps=100)))
+
+    builder = StateGraph(ToolState)
+    builder.add_node("tool_executor", cancellations.guard("tool_executor", graph_module.logging_tool_node))
+    builder.add_edge(START, "tool_executor")
+    builder.add_edge("tool_executor", END)
+    return builder.compile(checkpointer=InMemorySaver()), cancellations, tool_node
+
+
+def test_resumed_tool_step_reuses_results_finished_before_cancel(tool_graph):
+    graph, cancellations, tool_node = tool_graph
+    config = {"configurable": {"thread_id": "plan-1"}}
+    turn = AIMessage(
+        content="",
+        tool_calls=[
+            {"name": "maps_weather", "args": {"city": "杭州"}, "id": "call-weather", "type": "tool_call"},
+            {"name": "maps_text_search", "args": {"keywords": "景点", "city": "杭州"}, "id": "call-search", "type": "tool_call"},
+        ],
+    )
+
+    async def cancel_then_resume():
+        # 平台的 run-cancel API 取消的是执行 run 的 asyncio 任务
+        run = asyncio.create_task(graph.ainvoke({"messages": [turn], "mcp_result": []}, config))
+        await asyncio.sleep(0.3)
+        run.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await run
+        # 在同一个 thread 上用 input=None 恢复
+        tool_node.delays["maps_text_search"] = 0.0
+        return await graph.ainvoke(None, config)
+
+    state = asyncio.run(cancel_then_resume())
+
+    # 取消前已经完成的天气查询来自 checkpoint，不会再调用一次
+    assert tool_node.calls == ["maps_weather", "maps_text_search", "maps_text_search"]
+    assert [entry["tool_name"] for entry in state["mcp_result"]] == ["maps_weather", "maps_text_search"]
+    assert cancellations.metrics()["runs_cancelled"] == 1
+    assert cancellations.metrics()["inflight_nodes_cancelled"] == {"tool_executor": 1}
+
+
+def test_concurrent_nodes_of_a_cancelled_run_count_once():
+    cancellations = CancellationRegistry(remaining_llm_calls=lambda state: 2)
+    config = {"configurable": {"thread_id": "plan-1", "run_id": "run-1"}}
+
+    async def node(state, config):
+        await asyncio.sleep(10)
+
+    async def scenario():
+        nodes = [
+            asyncio.create_task(cancellations.guard(name, node)({}, config))
+            for name in ("agent", "web_research")
+        ]
+        await asyncio.sleep(0.05)
+        for task in nodes:
+            task.cancel()
+        results = await asyncio.gather(*nodes, return_exceptions=True)
+        assert all(isinstance(r, asyncio.CancelledError) for r in results)
+
+    asyncio.run(scenario())
+    metrics = cancellations.metrics()
+    assert metrics["runs_cancelled"] == 1
+    assert metrics["estimated_llm_calls_saved"] == 2
+    assert metrics["inflight_nodes_cancelled"] == {"agent": 1, "web_research": 1}
+
+
+def test_quota_rejections_are_logged_as_errors(tool_graph, monkeypatch):
+    graph, _, tool_node = tool_graph
+    monkeypatch.setattr(graph_module, "amap_quota", QuotaGovernor(QuotaLimits(global_qps=100, session_qps=100, daily_limit=1)))
+    turn = AIMessage(
+        content="",
+        tool_calls=[
+            {"name": "maps_weather", "args": {"city": "成都"}, "id": "call-weather", "type": "tool_call"},
+            {"name": "maps_text_search", "args": {"keywords": "景点", "city": "成都"}, "id": "call-search", "type": "tool_call"},
+        ],
+    )
+    tool_node.delays["maps_text_search"] = 0.0
+
+    state = asyncio.run(graph.ainvoke({"messages": [turn], "mcp_result": []}, {"configurable": {"thread_id": "plan-2"}}))
+
+    assert [entry["status"] for entry in state["mcp_result"]] == ["success", "error"]
+    assert tool_node.calls == ["maps_weather"]
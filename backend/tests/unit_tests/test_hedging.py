@@ -0,0 +1,167 @@
+import asyncio
+import importlib
+
+import pytest
+from langchain_core.language_models import GenericFakeChatModel
+from langchain_core.messages import AIMessage
+from langchain_core.runnables import RunnableLambda
+from pydantic import ValidationError
+
+from agent.configuration import Configuration
+from agent.hedging import HedgedInvoker
+from agent.tools_and_schemas import LocationInfo
+
+# import the graph module itself, not the compiled graph agent/__init__.py exports
+graph_module = importlib.import_module("agent.graph")
+
+
+class SlowFakeChatModel(GenericFakeChatModel):
+    """Fake chat model that takes ``delay`` seconds per call."""
+
+    delay: float = 0.0
+
+    async def ainvoke(self, input, config=None, **kwargs):
+        await asyncio.sleep(self.delay)
+        return await super().ainvoke(input, config, **kwargs)
+
+
+class FakeStructuredChatModel(SlowFakeChatModel):
+    """Fake chat model whose structured output is parsed from the raw reply."""
+
+    def with_structured_output(self, schema, include_raw=False, **kwargs):
+        async def parse(prompt):
+            raw = await self.ainvoke(prompt)
+            try:
+                parsed = schema.model_validate_json(raw.content)
+            except ValidationError as e:
+                return {"raw": raw, "parsed": None, "parsing_error": e}
+            return {"raw": raw, "parsed": parsed, "parsing_error": None}
+
+        return RunnableLambda(parse)
+
+
+def fake_model(*replies, delay=0.0, cls=SlowFakeChatModel):
+    return cls(messages=iter(replies), delay=delay)
+
+
+def reply(content, input_tokens=100, cached=0, output_tokens=10):
+    return AIMessage(
+        content=content,
+        usage_metadata={
+            "input_tokens": input_tokens,
+            "output_tokens": output_tokens,
+            "total_tokens": input_tokens + output_tokens,
+            "input_token_details": {"cache_read": cached},
+        },
+    )
+
+
+def test_fast_primary_wins_without_hedging():
+    hedger = HedgedInvoker(default_delay_s=1.0)
+    primary, backup = fake_model(reply("primary")), fake_model(reply("backup"))
+
+    result = asyncio.run(hedger.ainvoke("k", lambda: primary.ainvoke("hi"), lambda: backup.ainvoke("hi")))
+
+    assert result.content == "primary"
+    stats = hedger.stats("k")
+    assert (stats.primary_wins, stats.hedged, stats.hedge_wins) == (1, 0, 0)
+    assert len(stats.latencies) == 1
+
+
+def test_slow_primary_is_hedged_and_its_own_latency_recorded():
+    hedger = HedgedInvoker(default_delay_s=0.05, min_delay_s=0.0)
+    hedger.budget.tokens = 1.0
+    primary = fake_model(reply("primary"), delay=0.5)
+    backup = fake_model(reply("backup"), delay=0.0)
+
+    result = asyncio.run(
+        hedger.ainvoke("k", lambda: primary.ainvoke("hi"), lambda: backup.ainvoke("hi"), budget_ratio=0.0)
+    )
+
+    assert result.content == "backup"
+    stats = hedger.stats("k")
+    assert (stats.hedged, stats.hedge_wins, stats.primary_wins) == (1, 1, 0)
+    # 记录的是被取消的主请求已经花掉的时间，而不是备用请求的延迟
+    assert stats.latencies[0] >= 0.05
+
+
+def test_hedge_is_skipped_without_budget():
+    hedger = HedgedInvoker(default_delay_s=0.01, min_delay_s=0.0)
+    primary = fake_model(reply("primary"), delay=0.05)
+    backup = fake_model(reply("backup"))
+
+    result = asyncio.run(
+        hedger.ainvoke("k", lambda: primary.ainvoke("hi"), lambda: backup.ainvoke("hi"), budget_ratio=0.0)
+    )
+
+    assert result.content == "primary"
+    assert hedger.stats("k").budget_denied == 1
+
+
+def test_invalid_primary_falls_back_to_backup():
+    hedger = HedgedInvoker(default_delay_s=1.0)
+    primary, backup = fake_model(reply("")), fake_model(reply("backup"))
+
+    result = asyncio.run(
+        hedger.ainvoke(
+            "k",
+            lambda: primary.ainvoke("hi"),
+            lambda: backup.ainvoke("hi"),
+            is_valid=lambda message: bool(message.content),
+        )
+    )
+
+    assert result.content == "backup"
+    stats = hedger.stats("k")
+    assert (stats.fallbacks, stats.hedge_wins) == (1, 1)
+
+
+@pytest.fixture
+def fake_models(monkeypatch):
+    models = {}
+    monkeypatch.setattr(graph_module, "get_chat_model", lambda name: models[name])
+    monkeypatch.setattr(graph_module, "hedger", HedgedInvoker(default_delay_s=0.05, min_delay_s=0.0))
+    graph_module.hedger.budget.tokens = 5.0
+    return models
+
+
+def test_invoke_agent_model_hedges_with_backup_model(fake_models):
+    fake_models["primary"] = fake_model(reply("slow"), delay=0.5)
+    fake_models["backup"] = fake_model(reply("fast"))
+    configurable = Configuration(hedge_requests=True, hedge_model="backup", use_prompt_cache=False)
+
+    response = asyncio.run(graph_module._invoke_agent_model("gather", "primary", [], [("user", "hi")], configurable))
+
+    assert response.content == "fast"
+    assert graph_module.hedger.metrics()["agent:gather:primary"]["hedge_wins"] == 1
+
+
+def test_invoke_agent_model_without_hedging(fake_models):
+    fake_models["primary"] = fake_model(reply("answer"))
+    configurable = Configuration(hedge_requests=False, use_prompt_cache=False)
+
+    response = asyncio.run(graph_module._invoke_agent_model("gather", "primary", [], [("user", "hi")], configurable))
+
+    assert response.content == "answer"
+    assert graph_module.hedger.metrics() == {}
+
+
+def test_structured_call_repairs_truncated_output(fake_models):
+    truncated = '{"is_location_info": true, "is_date_info": false, "location": "杭州", "date": "2025-'
+    fake_models["primary"] = fake_model(
+        reply(truncated, input_tokens=200, cached=150),
+        # 只为缺失的 date 字段补一次请求
+        reply('{"date": ""}', input_tokens=50),
+        cls=FakeStructuredChatModel,
+    )
+    configurable = Configuration(hedge_requests=True, hedge_model="primary")
+
+    result, step = asyncio.run(
+        graph_module._structured_call("check_location_info", "cheap", "primary", LocationInfo, "杭州", configurable)
+    )
+
+    assert result == LocationInfo(is_location_info=True, is_date_info=False, location="杭州", date="")
+    assert step["input_tokens"] == 250
+    assert step["cached_input_tokens"] == 150
+    # 截断但可修复的输出不会触发对冲的备用请求
+    assert graph_module.hedger.metrics()["check_location_info:primary"]["primary_wins"] == 1
@@ -0,0 +1,79 @@
+import json
+import random
+
+import pytest
+
+from agent.poi_store import (
+    LocalPoiBackend,
+    MonthlyClimate,
+    PoiRecord,
+    PoiStore,
+    _haversine_m,
+    build_poi_store,
+)
+
+
+@pytest.fixture
+def store(tmp_path):
+    rng = random.Random(7)
+    records = [
+        PoiRecord(
+            city=city,
+            category=category,
+            name=f"{city}{category}{i}",
+            lon=lon + rng.uniform(-0.05, 0.05),
+            lat=lat + rng.uniform(-0.05, 0.05),
+            rating=round(rng.uniform(3, 5), 1),
+        )
+        for city, lon, lat in (("杭州市", 120.15, 30.28), ("成都市", 104.07, 30.67))
+        for category in ("美食", "酒店", "景点")
+        for i in range(200)
+    ]
+    records.append(PoiRecord(city="成都市", category="景点", name="西湖", lon=104.0, lat=30.6))
+    records.append(PoiRecord(city="杭州市", category="景点", name="西湖", lon=120.14, lat=30.25, rating=4.9))
+    path = str(tmp_path / "poi.store")
+    climate = {"杭州市": [MonthlyClimate(high_c=8.0, low_c=1.0, precipitation_mm=70.0)] * 12}
+    build_poi_store(path, records, climate)
+    store = PoiStore(path)
+    yield store
+    store.close()
+
+
+def test_match_category_requires_exact_name_or_alias(store):
+    assert store.match_category("美食") == "美食"
+    assert store.match_category(" 住宿 ") == "酒店"
+    assert store.match_category("") is None
+    assert store.match_category(None) is None
+    # 不能因为是子串就匹配到某个类别
+    assert store.match_category("美") is None
+    assert store.match_category("美食街") is None
+
+
+def test_geocode_uses_name_index(store):
+    assert store.geocode("西湖", "杭州")["cityname"] == "杭州市"
+    assert store.geocode("西湖", "成都市")["cityname"] == "成都市"
+    assert store.geocode("杭州市美食17")["name"] == "杭州市美食17"
+    assert store.geocode("西湖", "北京") is None
+    assert store.geocode("不存在的地方") is None
+    assert store.geocode("") is None
+
+
+def test_search_around_matches_brute_force(store):
+    found = store.search_around(120.15, 30.28, "美食", radius_m=2000, limit=1000)
+    names = {poi["name"] for poi in found}
+    expected = set()
+    for i in range(200):
+        poi = store.geocode(f"杭州市美食{i}", "杭州")
+        lon, lat = map(float, poi["location"].split(","))
+        if _haversine_m(120.15, 30.28, lon, lat) <= 2000:
+            expected.add(poi["name"])
+    assert names == expected
+    ratings = [poi["rating"] for poi in found]
+    assert ratings == sorted(ratings, reverse=True)
+
+
+def test_backend_answers_only_matching_categories(store):
+    backend = LocalPoiBackend(store)
+    answer = backend.answer("maps_text_search", {"keywords": "餐厅", "city": "杭州"})
+    assert json.loads(answer)["pois"][0]["type"] == "美食"
+    assert backend.answer("maps_text_search", {"keywords": "", "city": "杭州"}) is None
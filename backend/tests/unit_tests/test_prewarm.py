@@ -0,0 +1,135 @@
+import asyncio
+import json
+import time
+
+from fakeredis import FakeAsyncRedis, FakeServer
+
+from agent.prewarm import PlanSkeleton, PrewarmCache, PrewarmScheduler, RedisDemandLog, RedisSkeletonStore
+from agent.tool_selection import planning_phase
+
+
+def test_demand_is_shared_between_replicas_through_redis():
+    server = FakeServer()
+    replicas = [PrewarmCache(demand_log=RedisDemandLog(FakeAsyncRedis(server=server))) for _ in range(2)]
+
+    async def scenario():
+        await replicas[0].arecord_plan("杭州市", "2025-10-01 to 2025-10-03")
+        await replicas[1].arecord_plan("杭州", "2025年10月")
+        await replicas[1].arecord_plan("成都", "2025-11-02")
+        return await replicas[0].ahot_keys(5)
+
+    hot = asyncio.run(scenario())
+    assert hot[0] == (("杭州", "2025-10"), 2.0)
+    assert hot[1] == (("成都", "2025-11"), 1.0)
+
+
+class BrokenRedis:
+    def pipeline(self):
+        raise ConnectionError("redis is down")
+
+
+def test_demand_falls_back_to_local_counts_when_redis_fails():
+    cache = PrewarmCache(demand_log=RedisDemandLog(BrokenRedis()))
+
+    async def scenario():
+        await cache.arecord_plan("杭州", "2025-10-01")
+        return await cache.ahot_keys(5), await cache.ametrics()
+
+    hot, metrics = asyncio.run(scenario())
+    assert hot == [(("杭州", "2025-10"), hot[0][1])]
+    assert metrics["demand_log_errors"] == 3
+
+
+async def fake_amap(calls, tool_name, args):
+    calls.append(tool_name)
+    if tool_name == "maps_text_search":
+        return json.dumps({"pois": [{"name": f"景点{i}", "location": f"120.1{i},30.2"} for i in range(3)]})
+    if tool_name == "maps_around_search":
+        category = "餐饮服务" if args["keywords"] == "美食" else "住宿服务"
+        return json.dumps({"pois": [{"name": "x", "type": category}]})
+    return "{}"
+
+
+def shared_cache(server):
+    client = FakeAsyncRedis(server=server)
+    return PrewarmCache(demand_log=RedisDemandLog(client), skeleton_store=RedisSkeletonStore(client))
+
+
+def test_scheduler_warms_hot_destinations_into_a_skeleton():
+    cache = PrewarmCache()
+    calls = []
+    scheduler = PrewarmScheduler(
+        cache, lambda name, args: fake_amap(calls, name, args), calls_per_minute=60000, off_peak_hours="0-24", busy_window_seconds=0
+    )
+
+    async def scenario():
+        await cache.arecord_plan("杭州", "")
+        built = await scheduler.run_once()
+        return built, await cache.aseed_plan("杭州")
+
+    built, (messages, mcp_result) = asyncio.run(scenario())
+    assert built == 1
+    assert calls.count("maps_around_search") == 2
+    # 从骨架开始的规划直接进入最后一步
+    assert planning_phase(mcp_result) == "finalize"
+    assert len(messages) == len(mcp_result) + 1
+
+
+def test_one_replica_warms_and_every_replica_seeds_from_redis():
+    server = FakeServer()
+    replicas = [shared_cache(server) for _ in range(2)]
+    calls = [[], []]
+    schedulers = [
+        PrewarmScheduler(
+            cache, lambda name, args, log=log: fake_amap(log, name, args),
+            calls_per_minute=60000, off_peak_hours="0-24", busy_window_seconds=0,
+        )
+        for cache, log in zip(replicas, calls)
+    ]
+
+    async def scenario():
+        await replicas[0].arecord_plan("杭州", "")
+        # 另一个副本持有锁时这一轮不预热
+        assert await replicas[1].alead("someone-else", 60)
+        assert await schedulers[0].run_once() == 0
+        await replicas[1].aresign("someone-else")
+        built = await schedulers[0].run_once()
+        # 骨架已经在 Redis 里，第二个副本不会再调用 AMap
+        rebuilt = await schedulers[1].run_once()
+        return built, rebuilt, await replicas[1].aseed_plan("杭州")
+
+    built, rebuilt, (_, mcp_result) = asyncio.run(scenario())
+    assert (built, rebuilt) == (1, 0)
+    assert calls[1] == []
+    assert planning_phase(mcp_result) == "finalize"
+    assert replicas[0]._stats["prewarm_cycles_skipped"] == 1
+
+
+def test_stale_weather_is_left_out_of_the_seeded_plan():
+    cache = PrewarmCache()
+    entries = [
+        {"tool_name": "maps_weather", "tool_input": {"city": "杭州"}, "tool_output": "{}", "status": "success"},
+        {"tool_name": "maps_geo", "tool_input": {"address": "西湖"}, "tool_output": "{}", "status": "success"},
+    ]
+
+    async def scenario():
+        await cache.astore_skeleton(PlanSkeleton("杭州", entries, built_at=time.time() - 4 * 3600))
+        return await cache.ais_fresh("杭州"), await cache.aseed_plan("杭州")
+
+    fresh, (_, mcp_result) = asyncio.run(scenario())
+    assert not fresh
+    # 天气要重新查询，其余结果照常复用
+    assert [entry["tool_name"] for entry in mcp_result] == ["maps_geo"]
+    assert planning_phase(mcp_result) == "gather"
+
+
+def test_plans_on_any_replica_pause_warming():
+    server = FakeServer()
+    replicas = [shared_cache(server) for _ in range(2)]
+
+    async def scenario():
+        before = await replicas[1].arecently_planned(60)
+        await replicas[0].arecord_plan("成都", "")
+        return before, await replicas[1].arecently_planned(60)
+
+    assert asyncio.run(scenario()) == (False, True)
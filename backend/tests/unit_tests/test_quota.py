@@ -0,0 +1,74 @@
+import asyncio
+from datetime import datetime
+
+import pytest
+from fakeredis import FakeAsyncRedis
+
+from agent.quota import (
+    QUOTA_TIMEZONE,
+    LocalQuotaBackend,
+    QuotaExceeded,
+    QuotaGovernor,
+    QuotaLimits,
+    RedisQuotaBackend,
+    _daily_key,
+)
+
+
+@pytest.fixture(params=["redis", "local"])
+def backend(request):
+    if request.param == "redis":
+        # FakeAsyncRedis 需要 lupa 才能执行令牌桶的 Lua 脚本
+        return RedisQuotaBackend(FakeAsyncRedis())
+    return LocalQuotaBackend()
+
+
+def test_bucket_allows_capacity_then_asks_to_wait(backend):
+    async def scenario():
+        buckets = [("global", 2.0, 2.0)]
+        results = [await backend.try_acquire(buckets, daily_limit=0) for _ in range(3)]
+        return results
+
+    (first, _), (second, _), (third, wait) = asyncio.run(scenario())
+    assert (first, second, third) == (1, 1, 0)
+    assert 0 < wait <= 0.5
+
+
+def test_daily_limit_rejects(backend):
+    async def scenario():
+        buckets = [("global", 100.0, 100.0)]
+        return [(await backend.try_acquire(buckets, daily_limit=2))[0] for _ in range(3)]
+
+    assert asyncio.run(scenario()) == [1, 1, -1]
+
+
+def test_session_burst_covers_parallel_fan_out(backend):
+    limits = QuotaLimits(global_qps=100, session_qps=1.0, session_burst=6)
+    if isinstance(backend, RedisQuotaBackend):
+        governor = QuotaGovernor(limits, backend=backend)
+    else:
+        governor = QuotaGovernor(limits, fallback=backend)
+
+    async def fan_out():
+        return await asyncio.gather(*(governor.acquire("maps_around_search", "thread-1") for _ in range(6)))
+
+    waits = asyncio.run(fan_out())
+    # 一轮并行的 6 个调用都不需要等待
+    assert max(waits) < 0.1
+    assert governor.metrics()["backend"] == ("redis" if governor.backend else "local")
+
+
+def test_waits_beyond_max_wait_are_rejected():
+    governor = QuotaGovernor(QuotaLimits(global_qps=0.1, session_burst=1), max_wait_seconds=1.0)
+
+    async def scenario():
+        await governor.acquire("maps_weather", "thread-1")
+        with pytest.raises(QuotaExceeded):
+            await governor.acquire("maps_weather", "thread-1")
+
+    asyncio.run(scenario())
+    assert governor.metrics()["rejected_wait"] == 1
+
+
+def test_daily_key_uses_beijing_date():
+    assert _daily_key() == f"daily:{datetime.now(QUOTA_TIMEZONE):%Y%m%d}"
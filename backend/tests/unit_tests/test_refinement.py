@@ -0,0 +1,124 @@
+import json
+
+import pytest
+from pydantic import ValidationError
+
+from agent.refinement import (
+    PLAN_SECTIONS,
+    _poi_type_sections,
+    build_refinement_report,
+    collect_poi_outputs,
+    entry_sections,
+    normalize_sections,
+    partial_plan_model,
+    split_cached_results,
+    tools_for_sections,
+)
+from agent.tool_selection import planning_phase
+
+
+def entry(tool_name, tool_input=None, tool_output="{}"):
+    return {"tool_name": tool_name, "tool_input": tool_input or {}, "tool_output": tool_output, "status": "success"}
+
+
+def pois(*types):
+    return json.dumps({"pois": [{"name": f"poi{i}", "type": t} for i, t in enumerate(types)]}, ensure_ascii=False)
+
+
+@pytest.mark.parametrize(
+    "keywords, sections",
+    [
+        ("美食", ["food"]),
+        ("附近的餐厅", ["food"]),
+        ("酒店", ["hotel"]),
+        ("住宿", ["hotel"]),
+        ("美食 酒店", ["food", "hotel"]),
+        ("加油站", []),
+    ],
+)
+def test_around_search_sections_by_keyword(keywords, sections):
+    assert entry_sections(entry("maps_around_search", {"keywords": keywords})) == sections
+
+
+def test_around_search_sections_fall_back_to_poi_types():
+    food = entry("maps_around_search", {"keywords": "好吃的"}, pois("餐饮服务;中餐厅", "餐饮服务;快餐厅", "购物服务"))
+    assert entry_sections(food) == ["food"]
+    # 只有少数 POI 属于某一类时不认定
+    mixed = entry("maps_around_search", {"keywords": "随便"}, pois("住宿服务;宾馆酒店", "购物服务", "购物服务"))
+    assert entry_sections(mixed) == []
+
+
+@pytest.mark.parametrize("tool_output", ["not json", "[]", json.dumps({"pois": None}), None])
+def test_poi_type_sections_ignores_unparsable_output(tool_output):
+    assert _poi_type_sections(tool_output) == []
+
+
+def test_other_tools_map_to_their_sections():
+    assert entry_sections(entry("maps_weather")) == ["best_time", "weather"]
+    assert entry_sections(entry("maps_geo")) == ["view_points", "transportation"]
+    assert entry_sections(entry("maps_unknown")) == []
+
+
+def test_split_cached_results_marks_only_affected_calls_stale():
+    weather = entry("maps_weather", {"city": "杭州"})
+    food = entry("maps_around_search", {"keywords": "美食"})
+    hotel = entry("maps_around_search", {"keywords": "酒店"})
+
+    reused, stale = split_cached_results([weather, food, hotel], ["hotel"])
+
+    assert reused == [weather, food]
+    assert stale == [hotel]
+    assert split_cached_results(None, ["hotel"]) == ([], [])
+
+
+def test_collect_poi_outputs_separates_food_and_hotel():
+    log = [
+        entry("maps_weather"),
+        entry("maps_around_search", {"keywords": "美食"}, "food-1"),
+        entry("maps_around_search", {"keywords": "住宿"}, "hotel-1"),
+        entry("maps_around_search", {"keywords": "x"}, pois("餐饮服务;咖啡厅")),
+    ]
+
+    food, hotel = collect_poi_outputs(log)
+
+    assert food == ["food-1", pois("餐饮服务;咖啡厅")]
+    assert hotel == ["hotel-1"]
+
+
+def test_partial_plan_model_only_has_requested_sections():
+    model = partial_plan_model(["hotel", "tips"])
+
+    assert list(model.model_fields) == ["hotel", "tips"]
+    assert model(hotel="h", tips="t").model_dump() == {"hotel": "h", "tips": "t"}
+    with pytest.raises(ValidationError):
+        model(hotel="h")
+
+
+def test_normalize_sections_and_tools():
+    assert normalize_sections(["tips", " food ", "unknown", "food"]) == ["food", "tips"]
+    assert tools_for_sections(["weather", "best_time"]) == ["maps_weather", "climate_norms"]
+
+
+def test_refinement_report_counts_skipped_work():
+    report = build_refinement_report(["hotel"], tool_calls_run=1, tool_calls_reused=3)
+
+    assert report["reused_sections"] == [s for s in PLAN_SECTIONS if s != "hotel"]
+    assert report["tool_calls_skipped_ratio"] == 0.75
+
+
+def test_failed_calls_are_not_reused_or_collected():
+    weather = {**entry("maps_weather"), "status": "error"}
+    food = {**entry("maps_around_search", {"keywords": "美食"}, "Error: quota"), "status": "error"}
+    hotel = entry("maps_around_search", {"keywords": "酒店"}, "hotel-1")
+
+    assert collect_poi_outputs([weather, food, hotel]) == ([], ["hotel-1"])
+    # 出错的调用在刷新对应部分时作为过期调用重跑，其余情况直接丢弃
+    assert split_cached_results([weather, food, hotel], ["food"]) == ([hotel], [food])
+
+
+def test_failed_calls_do_not_complete_a_phase():
+    ok = [{**entry("maps_weather"), "conversation_id": "t1"}]
+    rejected = [{**entry("maps_weather"), "status": "error", "conversation_id": "t1"}]
+
+    assert planning_phase(ok) == "locate"
+    assert planning_phase(rejected) == "gather"
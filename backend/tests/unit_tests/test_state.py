@@ -0,0 +1,17 @@
+from agent.state import NEW_PLAN, extend_steps, merge_token_usage
+
+
+def test_token_usage_restarts_at_the_first_step_of_a_turn():
+    usage = merge_token_usage({}, {NEW_PLAN: True, "llm_calls": 1, "input_tokens": 100})
+    usage = merge_token_usage(usage, {"llm_calls": 1, "input_tokens": 50})
+    assert usage == {"llm_calls": 2, "input_tokens": 150}
+
+    # 下一轮（追问或新计划）的第一步不带上一轮的累计
+    usage = merge_token_usage(usage, {NEW_PLAN: True, "llm_calls": 1, "input_tokens": 10})
+    assert usage == {"llm_calls": 1, "input_tokens": 10}
+    assert merge_token_usage(usage, {}) == usage
+
+
+def test_steps_restart_on_new_plan_marker():
+    assert extend_steps(["a"], ["b"]) == ["a", "b"]
+    assert extend_steps(["a"], [NEW_PLAN, "c"]) == ["c"]
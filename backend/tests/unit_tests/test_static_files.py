@@ -0,0 +1,69 @@
+import asyncio
+
+import pytest
+
+from agent.static_files import PrecompressedStaticFiles
+
+IMMUTABLE = "public, max-age=31536000, immutable"
+
+
+async def get(app, path, headers=()):
+    messages = []
+
+    async def receive():
+        return {"type": "http.request", "body": b""}
+
+    async def send(message):
+        messages.append(message)
+
+    await app({"type": "http", "method": "GET", "path": path, "headers": list(headers)}, receive, send)
+    start = messages[0]
+    return start["status"], {k.decode(): v.decode() for k, v in start["headers"]}, messages[-1]["body"]
+
+
+@pytest.fixture
+def frontend(tmp_path):
+    files = {
+        "index.html": "<html>" + "x" * 2000 + "</html>",
+        "assets/index-DyT4bX9a.js": "console.log(1);" * 200,
+        "assets/logo-a1b2c3d4.svg": "<svg/>",
+        "assets/hero-building.png": "png",
+        "apple-touch-icon.png": "png",
+        "android-chrome-192x192.png": "png",
+        "og-image-large.png": "png",
+        "my-background.jpg": "jpg",
+    }
+    for name, content in files.items():
+        (tmp_path / name).parent.mkdir(parents=True, exist_ok=True)
+        (tmp_path / name).write_text(content)
+    return PrecompressedStaticFiles(tmp_path)
+
+
+@pytest.mark.parametrize(
+    "path, immutable",
+    [
+        ("/assets/index-DyT4bX9a.js", True),
+        ("/assets/logo-a1b2c3d4.svg", True),
+        ("/assets/hero-building.png", False),
+        ("/apple-touch-icon.png", False),
+        ("/android-chrome-192x192.png", False),
+        ("/og-image-large.png", False),
+        ("/my-background.jpg", False),
+        ("/index.html", False),
+    ],
+)
+def test_only_hashed_vite_assets_are_immutable(frontend, path, immutable):
+    status, headers, _ = asyncio.run(get(frontend, path))
+    assert status == 200
+    assert (headers["cache-control"] == IMMUTABLE) is immutable
+
+
+def test_precompressed_variant_and_not_modified(frontend):
+    status, headers, body = asyncio.run(get(frontend, "/", [(b"accept-encoding", b"gzip")]))
+    assert status == 200 and headers["content-encoding"] == "gzip"
+    assert int(headers["content-length"]) == len(body)
+
+    status, _, body = asyncio.run(
+        get(frontend, "/", [(b"accept-encoding", b"gzip"), (b"if-none-match", headers["etag"].encode())])
+    )
+    assert status == 304 and body == b""
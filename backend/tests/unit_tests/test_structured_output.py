@@ -0,0 +1,95 @@
+import json
+from typing import List
+
+import pytest
+from langchain_core.messages import AIMessage
+from pydantic import BaseModel
+
+from agent.structured_output import StructuredOutputRepair, _coerce, close_json
+
+
+class Plan(BaseModel):
+    title: str
+    tips: str
+    days: List[str]
+
+
+def closed(text):
+    repaired, defects = close_json(text)
+    return json.loads(repaired), defects
+
+
+def test_close_json_strips_fences_and_trailing_commas():
+    data, defects = closed('```json\n{"title": "杭州", "days": ["a", "b",],}\n```')
+    assert data == {"title": "杭州", "days": ["a", "b"]}
+    assert defects == ["trailing_comma", "trailing_comma"]
+
+
+@pytest.mark.parametrize(
+    "text, expected",
+    [
+        # 截断在字符串中间：丢掉这个字段
+        ('{"title": "杭州", "tips": "多带', {"title": "杭州"}),
+        # 数组里的字符串被截断：整个数组都当作缺失，而不是只保留前几项
+        ('{"title": "杭州", "days": ["第一天", "第二', {"title": "杭州"}),
+        # 嵌套对象被截断时也不能留下一个看起来完整的 {}
+        ('{"title": "杭州", "meta": {"a": "1", "b": "', {"title": "杭州"}),
+        ('{"title": "杭州", "meta": {', {"title": "杭州"}),
+        ('{"title": "杭州", "days": ["第一天"], "ti', {"title": "杭州", "days": ["第一天"]}),
+        ('{"title": "杭', {}),
+    ],
+)
+def test_close_json_drops_truncated_fields(text, expected):
+    data, defects = closed(text)
+    assert data == expected
+    assert defects == ["truncated"]
+
+
+def test_close_json_without_object():
+    assert close_json("no json here") == (None, [])
+
+
+@pytest.mark.parametrize(
+    "value, annotation, expected",
+    [
+        (["上午西湖", None, "", "下午灵隐寺"], str, "上午西湖\n下午灵隐寺"),
+        ({"a": 1}, str, '{"a": 1}'),
+        (3, str, "3"),
+        ("是", bool, True),
+        ("no", bool, False),
+        ("西湖，灵隐寺、 雷峰塔", List[str], ["西湖", "灵隐寺", "雷峰塔"]),
+    ],
+)
+def test_coerce_fixes_type_mismatches(value, annotation, expected):
+    assert _coerce(value, annotation) == (expected, True)
+
+
+def test_coerce_leaves_matching_values_alone():
+    assert _coerce("ok", str) == ("ok", False)
+    assert _coerce("maybe", bool) == ("maybe", False)
+
+
+def test_salvage_reports_truncated_and_empty_fields_as_missing():
+    repair = StructuredOutputRepair()
+    raw = AIMessage(content='{"title": "杭州", "tips": [], "days": ["第一天", "第')
+
+    values, missing, defects = repair.salvage(Plan, raw)
+
+    assert values == {"title": "杭州"}
+    assert missing == ["tips", "days"]
+    assert defects == ["truncated"]
+
+
+def test_salvage_coerces_and_fills_optional_defaults():
+    repair = StructuredOutputRepair()
+    raw = AIMessage(content='{"title": "杭州", "tips": ["早点出发", "带伞"], "days": "第一天，第二天"}')
+
+    values, missing, defects = repair.salvage(Plan, raw)
+
+    assert values == {"title": "杭州", "tips": "早点出发\n带伞", "days": ["第一天", "第二天"]}
+    assert missing == []
+    assert defects == ["coerced:tips", "coerced:days"]
+
+    values, missing, defects = repair.salvage(Plan, AIMessage(content='{"title": "杭州"}'), optional={"tips": ""})
+    assert values["tips"] == "" and missing == ["days"]
+    assert defects == ["default:tips"]
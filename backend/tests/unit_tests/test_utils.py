@@ -0,0 +1,49 @@
+from types import SimpleNamespace
+
+from agent.utils import _byte_to_char_offsets, get_citations, insert_citation_markers, resolve_urls
+
+
+def segment(label, url="https://example.com/x"):
+    return {"label": label, "short_url": url, "value": url}
+
+
+def test_byte_to_char_offsets_with_multibyte_text():
+    text = "签证免费。门票80元。"
+    # 每个汉字和全角句号占 3 个字节，数字占 1 个
+    assert _byte_to_char_offsets(text, [0, 15, 23, 29]) == [0, 5, 9, 11]
+    assert _byte_to_char_offsets("ascii only", [3, 7]) == [3, 7]
+
+
+def test_insert_citation_markers_uses_byte_offsets_of_grounding_segments():
+    text = "杭州签证免费。西湖门票免费，灵隐寺门票75元。"
+    sentences = ["杭州签证免费。", "西湖门票免费，", "灵隐寺门票75元。"]
+    ends = [len("".join(sentences[: i + 1]).encode("utf-8")) for i in range(3)]
+    citations = [
+        {"start_index": 0, "end_index": ends[0], "segments": [segment("gov")]},
+        {"start_index": ends[0], "end_index": ends[2], "segments": [segment("trip")]},
+        {"start_index": ends[1], "end_index": ends[2], "segments": [segment("lingyin")]},
+    ]
+
+    marked = insert_citation_markers(text, citations, byte_offsets=True)
+
+    assert marked == (
+        "杭州签证免费。 [gov](https://example.com/x)西湖门票免费，灵隐寺门票75元。"
+        " [trip](https://example.com/x) [lingyin](https://example.com/x)"
+    )
+
+
+def test_citations_from_grounding_metadata_land_after_cited_chinese_text():
+    text = "故宫需要提前预约。"
+    chunk = SimpleNamespace(web=SimpleNamespace(uri="https://vertexaisearch/abc", title="dpm.org.cn"))
+    support = SimpleNamespace(
+        segment=SimpleNamespace(start_index=0, end_index=len(text.encode("utf-8"))),
+        grounding_chunk_indices=[0],
+    )
+    response = SimpleNamespace(
+        candidates=[SimpleNamespace(grounding_metadata=SimpleNamespace(grounding_supports=[support], grounding_chunks=[chunk]))]
+    )
+    resolved = resolve_urls([chunk], 0)
+
+    marked = insert_citation_markers(text, get_citations(response, resolved), byte_offsets=True)
+
+    assert marked == f"{text} [dpm]({resolved['https://vertexaisearch/abc']})"
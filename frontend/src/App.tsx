@@ -246,9 +246,13 @@ function App() {
       ];
 
       // 使用thread.submit调用真实的API
-      thread.submit({
-        messages: newMessages,
-      });
+      // 页面关闭或断开连接时让服务端取消这次规划，不再继续消耗 LLM 和 AMap 调用
+      thread.submit(
+        {
+          messages: newMessages,
+        },
+        { onDisconnect: "cancel" }
+      );
     } catch (error) {
       console.error("启动AI处理失败:", error);
       setError("启动AI处理失败，请重试");